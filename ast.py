@@ -1,7 +1,9 @@
+import time
 from typing import Dict, Iterable, List, overload
 from runtime import *
 from lexer import TokenKind
-from lexer import Lexer
+from lexer import Lexer, LineIndex, RegexLexer
+from numarray import NumArray
 import sparser
 class AST:
     pass
@@ -11,7 +13,9 @@ class SequenceNode(AST):
         self.first = first
         self.second = second
     def eval(self, state, subject):
-        self.first.eval(state, subject)
+        value = self.first.eval(state, subject)
+        if type(value) is Completion:
+            return value
         return self.second.eval(state, subject)
     def compile(self, state, subject, ind):
         try:
@@ -25,11 +29,16 @@ class Assign(AST):
         self.var = var
         self.assignment = assignment
         self.cmpt = cmpt
+        self.slot = None
     def __repr__(self):
         return self.var
     def eval(self, state, subject):
-        state.bind(self.var, self.assignment.eval(state, subject))
-        return (TypeChecker(self.var).check(state), self.var)
+        value = self.assignment.eval(state, subject)
+        if self.slot is None:
+            state.bind(self.var, value)
+        else:
+            state.slots[self.slot[1]] = value
+        return (type(value), self.var)
     def compile(self, state, subject, ind):
         if self.cmpt == None:
             return "    "*ind+"var "+self.var.compile(state, subject, ind)+" = "+self.assignment.compile(state, subject, ind)
@@ -94,10 +103,10 @@ class Print(AST):
     def __repr__(self):
         return f"print {self.data}"
     def eval(self, state, subject):
-        if self.data.eval(state, subject) is not None:
-            print(self.data.eval(state, subject))
-        else:
-            return None
+        # Evaluated once, a stream or a call may give something else the second time
+        value = self.data.eval(state, subject)
+        if value is not None:
+            print(value)
     def compile(self, state, subject, ind):
         return "    "*ind+"echo "+self.data.compile(state, subject, 0)
 
@@ -116,9 +125,13 @@ class BreakNode(AST):
     def __init__(self, cmpt, value):
         self.cmpt = cmpt
         self.value = value
+        # Set by the resolver when the loop is reached through statements alone, see mark_completions
+        self.signal = False
     def __repr__(self):
         return self.value
     def eval(self, state, subject):
+        if self.signal:
+            return Completion(self.value.eval(state, subject), True)
         raise EarlyBreak(self.value.eval(state, subject))
     def compile(self, state, subject, ind):
         if self.cmpt != None:
@@ -130,9 +143,13 @@ class ReturnNode(AST):
     def __init__(self, cmpt, value):
         self.cmpt = cmpt
         self.value = value
+        # Set by the resolver when the function is reached through statements alone, see mark_completions
+        self.signal = False
     def __repr__(self):
         return self.value
     def eval(self, state, subject):
+        if self.signal:
+            return Completion(self.value.eval(state, subject))
         raise EarlyReturn(self.value.eval(state, subject))
     def compile(self, state, subject, ind):
         if self.cmpt == None:
@@ -141,81 +158,101 @@ class ReturnNode(AST):
             raise str(EarlyReturn(self.value.eval(state, subject)))
 
 class FunctionNode(AST):
-    def __init__(self, cmpt: AST, name: AST, params: Dict[str, str], return_type: AST, body: AST):
+    def __init__(self, cmpt: AST, name: AST, params: Dict[str, str], return_type: AST, body: AST, memo: int = None, asynchronous: bool = False, offset: int = None):
         self.cmpt = cmpt
         self.name = name
         self.params = params
         self.return_type = return_type
         self.body = body
         self.params = params
+        self.frame = None
+        self.tail_calls = False
+        # Cache size for `func memo`, None when calls are not cached
+        self.memo = memo
+        # `async func`, whose calls give a coroutine to await or spawn
+        self.asynchronous = asynchronous
+        # Where the definition starts in the source, for the errors of its calls
+        self.offset = offset
 
     def __repr__(self):
         return f'func {self.name} ({self.params}) ${self.return_type} { {self.body} }'
 
-    def eval(self, state, subject):
-        state_copy = State()
-        state_copy.vals = state.vals.copy()
+    # BUILD THE FRAME OF ONE CALL, BOUND TO `self` AND THE ARGUMENTS
+    def enter(self, state, args, subject):
+        if len(args) != len(self.params):
+            raise SyntaxError(f"FunctionCallError: Invalid number of args. {where(subject, self.offset)}")
+        frame = State(state, self.frame)
+        if self.frame is None:
+            frame.bind("self", Scope(frame))
+            for (param, arg) in zip(self.params, args):
+                frame.bind(param, arg)
+        else:
+            # The resolver puts `self` in slot 0 and the params right after it
+            slots = frame.slots
+            slots[0] = Scope(frame)
+            slots[1:len(args)+1] = args
+        return frame
 
+    def eval(self, state, subject):
         def call_fn(*args):
-            state_copy = State()
-            state_copy.vals = state.vals.copy()
-            state_copy.bind("self", state_copy.vals)
-
-            if len(args) != len(self.params):
-                raise SyntaxError(f"FunctionCallError: Invalid number of args. Row: {subject.row}, Column: {subject.column}")
-
-            for (param, arg) in zip(self.params, args):
-                state_copy.bind(param, arg)
+            state_copy = self.enter(state, args, subject)
 
             try:
-                return self.body.eval(state_copy, subject)
+                value = self.body.eval(state_copy, subject)
+                if type(value) is not Completion:
+                    return value
+                value = value.value
             except EarlyReturn as ER:
-                if self.return_type != "any":
-                    if type(ER.value) == self.return_type.eval(current_state, subject):
-                        return ER.value
-                    if type(ER.value) != self.return_type.eval(current_state, subject):
-                        raise TypeReturnNode(f"Function did not return type specified. Row: {subject.row}, Column: {subject.column}")
-                else:
-                    return ER.value
+                value = ER.value
+            if self.return_type != "any":
+                if type(value) == self.return_type.eval(state, subject):
+                    return value
+                if type(value) != self.return_type.eval(state, subject):
+                    raise TypeReturnNode(f"Function did not return type specified. {where(subject, self.offset)}")
+            else:
+                return value
 
+        call_fn = profiler.wrap(self.name, call_fn)
+        if self.tail_calls:
+            # One pass through the body may end in a TailCall, the trampoline carries on from there
+            bounce = call_fn
+            def call_fn(*args):
+                return trampoline(bounce(*args))
+            call_fn.bounce = bounce
+        if self.memo is not None:
+            call_fn = Memo(call_fn, self.memo, self.name)
+        if self.asynchronous:
+            call_fn = tasks.AsyncFunction(call_fn, self.name)
         state.bind(self.name, call_fn)
-        state_copy.bind(self.name, call_fn)
     def compile(self, state, subject, ind):
         if self.cmpt == None:
             return "    "*ind+"proc "+self.name+"("+str(self.params)[1:-1].replace("'", "")+"): "+str(self.return_type)+" =\n"+"    "*ind+self.body.compile(state, subject, ind+1)
         else:
-            state_copy = State()
-            state_copy.vals = state.vals.copy()
-
             def call_fn(*args):
-                state_copy = State()
-                state_copy.vals = state.vals.copy()
-                if len(args) != len(self.params):
-                    raise SyntaxError(f"(COMPILE TIME) FunctionCallError: Invalid number of args. Row: {subject.row}, Column: {subject.column}")
-
-                for (param, arg) in zip(self.params, args):
-                    state_copy.bind(param, arg)
+                state_copy = self.enter(state, args, subject)
 
                 try:
                     return self.body.eval(state_copy, subject)
                 except EarlyReturn as ER:
                     if self.return_type != None:
-                        if type(ER.value) == self.return_type.eval(current_state, subject):
+                        if type(ER.value) == self.return_type.eval(state, subject):
                             return ER.value
-                        if type(ER.value) != self.return_type.eval(current_state, subject):
-                            raise TypeReturnNode(f"(COMPILE TIME) Function did not return type specified. Row: {subject.row}, Column: {subject.column}")
+                        if type(ER.value) != self.return_type.eval(state, subject):
+                            raise TypeReturnNode(f"(COMPILE TIME) Function did not return type specified. {where(subject, self.offset)}")
                     else:
                         return ER.value
-            state.bind(self.name, call_fn)
-            state_copy.bind(self.name, call_fn)
+            state.bind(self.name, tasks.AsyncFunction(call_fn, self.name) if self.asynchronous else call_fn)
 
 
 # Thanks Crunch! Very based!
 class Call(AST):
-    def __init__(self, cmpt: AST, func: AST, args: List[AST]):
+    def __init__(self, cmpt: AST, func: AST, args: List[AST], offset: int = None):
         self.func = func
         self.args = args
         self.cmpt = cmpt
+        self.tail = False
+        # Where the callee starts in the source
+        self.offset = offset
     def __repr__(self):
         return self.func
     def eval(self, state, subject):
@@ -223,14 +260,16 @@ class Call(AST):
 
         if callable(function):
             args = map(lambda arg: arg.eval(state, subject), self.args)
+            if self.tail:
+                return TailCall(function, list(args))
             return function(*args)
         else:
-            raise SyntaxError(f"FunctionCallError: The identifier {self.func} does not belong to a function. Row: {subject.row}, Column: {subject.column}")
+            raise SyntaxError(f"FunctionCallError: The identifier {self.func} does not belong to a function. {where(subject, self.offset)}")
 
     def compile(self, state, subject, ind):
         if self.cmpt == None:
-            args = map(lambda arg: arg.compile(state, subject, ind), self.args)
-            return "    "*ind+self.name+"("+helper(*args).replace("'", "").replace(")", "").replace("(", "")+")"
+            args = map(lambda arg: arg.compile(state, subject, 0), self.args)
+            return "    "*ind+self.func.compile(state, subject, 0)+"("+", ".join(args)+")"
         else:
             try:
                 function = state.lookup(self.name)
@@ -241,7 +280,30 @@ class Call(AST):
                 args = map(lambda arg: arg.eval(state, subject), self.args)
                 return str(function(*args))
             else:
-                raise SyntaxError(f"(COMPILE TIME) FunctionCallError: This identifier does not belong to a function. Row: {subject.row}, Column: {subject.column}")
+                raise SyntaxError(f"(COMPILE TIME) FunctionCallError: This identifier does not belong to a function. {where(subject, self.offset)}")
+
+# `await value`: what a coroutine, task or awaitable builtin gives once it is done, see tasks.py
+class Await(AST):
+    def __init__(self, value: AST):
+        self.value = value
+    def __repr__(self):
+        return f"await {self.value}"
+    def eval(self, state, subject):
+        return tasks.wait(self.value.eval(state, subject))
+    def compile(self, state, subject, ind):
+        # The Nim code runs its calls one after another
+        return self.value.compile(state, subject, ind)
+
+# `spawn value`: a task running the coroutine or awaitable while the code after it goes on
+class Spawn(AST):
+    def __init__(self, value: AST):
+        self.value = value
+    def __repr__(self):
+        return f"spawn {self.value}"
+    def eval(self, state, subject):
+        return tasks.spawn(self.value.eval(state, subject))
+    def compile(self, state, subject, ind):
+        return self.value.compile(state, subject, ind)
 
 class InputNode(AST):
     def __init__(self, prompt: AST):
@@ -257,10 +319,23 @@ class VarExpr(AST):
     def __init__(self, cmpt: AST, name: str):
         self.cmpt = cmpt
         self.name = name
+        self.slot = None
     def __repr__(self):
         return self.name
     def eval(self, state, subject):
-        return state.lookup(self.name)
+        if self.slot is None:
+            return state.lookup(self.name)
+        (depth, slot) = self.slot
+        while depth:
+            state = state.parent
+            depth -= 1
+        if slot is None:
+            return state.lookup(self.name)
+        value = state.slots[slot]
+        if value is UNBOUND:
+            # Declared in that frame but not bound yet, so it still resolves further out
+            return state.parent.lookup(self.name)
+        return value
     def compile(self, state, subject, ind):
         if self.cmpt == None:
             return "    "*ind+self.name
@@ -276,13 +351,11 @@ class Categories(AST):
     def __repr__(self):
         return f"category {self.name}({self.objects}) { {self.body} }"
     def eval(self, state, subject):
-        state_copy = State()
-        state_copy.vals = state.vals.copy()
+        state_copy = State(state)
 
         def call_fn(*args):
-            state_copy = State()
-            state_copy.vals = state.vals.copy()
-            state_copy.bind("self", state_copy.vals)
+            state_copy = State(state)
+            state_copy.bind("self", Scope(state_copy))
             try:
                 return self.body.eval(state_copy, subject)
             except:
@@ -290,7 +363,7 @@ class Categories(AST):
         state.bind(self.name, call_fn)
         state_copy.bind(self.name, call_fn)
         call_fn()
-        return state_copy.vals
+        return Scope(state_copy)
 
 class RaiseNode(AST):
     def __init__(self, value):
@@ -311,19 +384,16 @@ class Run(AST):
         return self.file
     def eval(self, state, subject):
         if self.c == None:
-            f = open(str(self.file)+'.soul', 'r')
-            inpt = f.read()
-            f.close()
-            ast = sparser.Parser(Lexer(inpt)).parse_statements()
-            return ast.eval(state, subject)
+            return modules.registry.import_into(self.file, state, lambda tree, namespace, lines: tree.eval(namespace, lines))
         elif self.c != None:
             f = open(str(self.file)+'.soul', 'r')
             inpt = f.read()
             f.close()
             start = time.time()
-            ast = sparser.Parser(Lexer(inpt)).parse_statements()
-            out = open(str(self.file)+".nim", 'w')
-            out.write(ast.compile(state, subject, ind))
+            with instrument.phase("transpile"):
+                ast = optimizer.optimize(sparser.Parser(RegexLexer(inpt)).parse_statements())
+                with open(str(self.file)+".nim", 'w') as out:
+                    emitter.transpile(ast, out, state, LineIndex(inpt))
             if self.roc == None:
                 return "Compiled in: "+str(time.time()-start)+" seconds"
             elif self.roc != None:
@@ -331,7 +401,7 @@ class Run(AST):
                 print(self.file)
                 def prCyan(skk): print('\x1b[0;36m' + skk + '\x1b[0m')
                 prCyan("\bExecuting with Nim compiler...")
-                sub.Popen(['cmd', '/K', f'nim c -r {self.file}'])
+                return build.build_and_run(str(self.file)+".nim")
     def compile(self, state, subject, ind):
         return "    "*ind+Run(None, None, self.file).eval(state, subject)
 
@@ -500,20 +570,30 @@ class WhileExpr(AST):
     def __repr__(self):
         return f"while {self.ret} {self.cond} { {self.left} }"
     def eval(self, state, subject):
+        if self.ret == "yield":
+            return Stream(self.stream(state, subject))
         x = []
-        if self.ret == None:
-            while self.cond.eval(state, subject):
-                try:
-                    x.append(self.left.eval(state, subject))
-                except EarlyBreak as EB:
-                    return EB.value
-        else:
-            while self.cond.eval(state, subject):
-                try:
-                    x.append(self.left.eval(state, subject))
-                except EarlyBreak as EB:
-                    return EB.value
+        while self.cond.eval(state, subject):
+            try:
+                value = self.left.eval(state, subject)
+            except EarlyBreak as EB:
+                return EB.value
+            if type(value) is Completion:
+                # A break ends this loop, a return carries on out to the function
+                return value.value if value.breaks else value
+            x.append(value)
+        if self.ret != None:
             return x
+    def stream(self, state, subject):
+        # The function that made the stream is long gone, so a break or a return only ends it
+        while self.cond.eval(state, subject):
+            try:
+                value = self.left.eval(state, subject)
+            except (EarlyBreak, EarlyReturn):
+                return
+            if type(value) is Completion:
+                return
+            yield value
     def compile(self, state, subject, ind):
         if self.cmpt == None:
             if self.ret == None:
@@ -558,17 +638,16 @@ class Array(AST):
     def __repr__(self):
         return f"{self.type} -> {self.values}"
     def eval(self, state, subject):
-        vals = set([type(i.eval(state, subject)) for i in self.values])
-        tvals = {}
-
-        for i in vals: tvals = i
-        if self.type != "any":
-            if tvals == state.lookup(self.type):
-                return self.values
-            else:
-                raise TypeError("Type of list elements did not match specification")
-        else:
-            return self.values
+        values = [value.eval(state, subject) for value in self.values]
+        if self.type == "any":
+            return values
+        kind = state.lookup(self.type)
+        if kind is int or kind is float:
+            # Numbers are kept in one buffer, and operators on the array apply to all of them at once
+            return NumArray.of(kind, values)
+        if any(type(value) != kind for value in values):
+            raise TypeError("Type of list elements did not match specification")
+        return values
 
 class BinOp(AST):
     def __init__(self, first: AST, op, second: AST):
@@ -641,3 +720,14 @@ class BinOp(AST):
         elif self.op == TokenKind.DOT:
             return "    "*ind+self.first.compile(state, subject, ind)+"."+self.second.compile(state, subject, ind)
 # if 1 == 1 {print "ea"}
+
+# Imported last, the resolver, the optimizer and the module registry need the node classes above
+import resolver
+import optimizer
+import modules
+import emitter
+import build
+import instrument
+import profiler
+import files
+import tasks
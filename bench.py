@@ -0,0 +1,257 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import platform
+import statistics
+import sys
+import time
+from lexer import Lexer, LineIndex, RegexLexer, TokenBuffer
+from sparser import Parser
+from runtime import State
+from vm import Compiler, VM
+from closures import ClosureCompiler
+from resolver import Resolver
+from optimizer import optimize
+from modules import registry
+from emitter import transpile
+
+########################################
+# ENGINE BENCHMARKS
+########################################
+
+def run_ast(ast, source):
+    return ast.eval(State(), LineIndex(source))
+
+def run_closure(ast, source):
+    return ClosureCompiler(LineIndex(source)).compile(ast)(State())
+
+def run_vm(ast, source):
+    return VM(LineIndex(source)).run(Compiler().compile_program(ast), State())
+
+ENGINES = {
+    'ast': run_ast,
+    'closure': run_closure,
+    'vm': run_vm,
+}
+
+def time_runs(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+def bench_engines(path, engines, repeat):
+    source = open(path, 'r').read()
+    ast = Resolver().resolve(optimize(Parser(RegexLexer(source)).parse_statements()))
+    results = {}
+    for name in engines:
+        # The programs print, keep that out of the measurement
+        with contextlib.redirect_stdout(io.StringIO()):
+            results[name] = time_runs(lambda: ENGINES[name](ast, source), repeat)
+    return results
+
+########################################
+# LEXER BENCHMARKS
+########################################
+
+LEXERS = {
+    'lexer': Lexer,
+    'regex': RegexLexer,
+    'buffer': TokenBuffer,
+}
+
+def corpus(path, megabytes):
+    # Chain copies of the program into one source about `megabytes` long
+    source = open(path, 'r').read()
+    return ';\n'.join([source] * max(1, int(megabytes * 1024 * 1024 / (len(source) + 2))))
+
+def bench_lexers(source, lexers, repeat):
+    results = {}
+    for name in lexers:
+        results[name] = time_runs(lambda: sum(1 for _ in LEXERS[name](source)), repeat)
+    return results
+
+########################################
+# PARSER BENCHMARKS
+########################################
+
+def bench_parser(source, lexers, repeat):
+    results = {}
+    for name in lexers:
+        results[name] = time_runs(lambda: Parser(LEXERS[name](source)).parse_statements(), repeat)
+    return results
+
+########################################
+# BENCHMARK SUITE
+########################################
+
+# Every workload is measured phase by phase, each phase on its own and N times over. Results are JSON with the
+# median and p95 of every phase, which can be saved as the baseline later runs are held against.
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+SUITE = {
+    'fib': 'fib.soul',
+    'calls': 'calls.soul',
+    'loops': 'bench/loops.soul',
+    'strings': 'bench/strings.soul',
+    'imports': 'bench/imports.soul',
+    'stress': 'bench/stress.soul',
+    'arrays': 'bench/arrays.soul',
+}
+
+PHASES = ('lex', 'parse', 'eval', 'compile')
+
+BASELINE = os.path.join(HERE, 'bench', 'baseline.json')
+
+# Medians this short are mostly timer noise and are never reported as regressions
+MIN_SECONDS = 0.001
+
+def p95(times):
+    # Nearest rank
+    ordered = sorted(times)
+    return ordered[math.ceil(0.95 * len(ordered)) - 1]
+
+def parse(source):
+    return Parser(RegexLexer(source)).parse_statements()
+
+def phases(source, engine):
+    resolved = Resolver().resolve(optimize(parse(source)))
+    optimized = optimize(parse(source))
+    def lex():
+        sum(1 for _ in RegexLexer(source))
+    def evaluate():
+        # Imports are run again every time, as in a fresh process
+        registry.modules.clear()
+        ENGINES[engine](resolved, source)
+    def emit():
+        registry.modules.clear()
+        transpile(optimized, io.StringIO(), State(), LineIndex(source))
+    return {'lex': lex, 'parse': lambda: parse(source), 'eval': evaluate, 'compile': emit}
+
+def bench_suite(workloads, engine, repeat):
+    results = {}
+    for name in workloads:
+        path = os.path.join(HERE, SUITE[name])
+        with open(path, 'r') as f:
+            source = f.read()
+        results[name] = {}
+        cwd = os.getcwd()
+        # Imports are looked up from the working directory
+        os.chdir(os.path.dirname(path))
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                for (phase, fn) in phases(source, engine).items():
+                    # One run first, so the files, caches and imports the phase touches are warm
+                    fn()
+                    times = time_runs(fn, repeat)
+                    results[name][phase] = {'median': statistics.median(times), 'p95': p95(times), 'min': min(times)}
+        finally:
+            os.chdir(cwd)
+    return {
+        'python': platform.python_implementation() + ' ' + platform.python_version(),
+        'engine': engine,
+        'runs': repeat,
+        'workloads': results,
+    }
+
+# The phases whose median grew past threshold (0.1 is 10%) since the baseline
+def regressions(results, baseline, threshold):
+    found = []
+    same_engine = results['engine'] == baseline.get('engine')
+    for (name, phases_) in results['workloads'].items():
+        for (phase, stats) in phases_.items():
+            before = baseline.get('workloads', {}).get(name, {}).get(phase)
+            if before is None or (phase == 'eval' and not same_engine):
+                continue
+            ratio = stats['median'] / before['median'] if before['median'] else math.inf
+            line = f'{name:<8} {phase:<8} {before["median"]:.4f}s -> {stats["median"]:.4f}s  x{ratio:.2f}'
+            if ratio > 1 + threshold and stats['median'] >= MIN_SECONDS:
+                found.append(line)
+                line += '  REGRESSION'
+            print(line, file=sys.stderr)
+    return found
+
+def load_baseline(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_baseline(path, results):
+    temp = f'{path}.{os.getpid()}.tmp'
+    with open(temp, 'w') as f:
+        json.dump(results, f, indent=2)
+        f.write('\n')
+    os.replace(temp, path)
+
+def run_suite(args):
+    results = bench_suite(args.workload or list(SUITE), (args.engine or ['vm'])[0], args.n)
+    print(json.dumps(results, indent=2))
+    if args.save:
+        save_baseline(args.baseline, results)
+        print(f'Saved the baseline to {args.baseline}', file=sys.stderr)
+        return 0
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f'No baseline at {args.baseline}, save one with --save', file=sys.stderr)
+        return 0
+    if baseline.get('engine') != results['engine']:
+        print(f'The baseline ran eval with {baseline.get("engine")}, eval is not compared', file=sys.stderr)
+    found = regressions(results, baseline, args.threshold)
+    if found:
+        print(f'{len(found)} phases slower than the baseline by more than {args.threshold:.0%}', file=sys.stderr)
+        return 1
+    return 0
+
+def report(results, baseline='ast', size=None):
+    base = min(results[baseline]) if baseline in results else None
+    for (name, times) in results.items():
+        best = min(times)
+        line = f'{name:<10} best {best:.4f}s  median {statistics.median(times):.4f}s'
+        if size is not None:
+            line += f'  {size/best/1024/1024:.1f} MB/s'
+        if base is not None and name != baseline:
+            line += f'  x{base/best:.1f} vs {baseline}'
+        print(line)
+
+def parse_cli_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('sourcefile', help='The Soul program to benchmark', nargs='?', default='fib.soul')
+    parser.add_argument('-n', help='Runs per engine', type=int, default=5)
+    parser.add_argument('--engine', help='Engines to compare', action='append', choices=list(ENGINES))
+    parser.add_argument('--lex', help='Measure lexing throughput instead of execution', action='store_true')
+    parser.add_argument('--parse', help='Measure lexing and parsing throughput instead of execution', action='store_true')
+    parser.add_argument('--lexer', help='Lexers to compare', action='append', choices=list(LEXERS))
+    parser.add_argument('--size', help='Megabytes of source to lex or parse', type=float, default=4)
+    parser.add_argument('--suite', help='Time every phase of the workloads in bench/ and print JSON', action='store_true')
+    parser.add_argument('--workload', help='Workloads of the suite to run', action='append', choices=list(SUITE))
+    parser.add_argument('--baseline', help='The results --suite is compared with', default=BASELINE)
+    parser.add_argument('--save', help='Save the results of --suite as the baseline', action='store_true')
+    parser.add_argument('--threshold', help='How much slower a median may get before --suite fails, 0.1 is 10%%', type=float, default=0.1)
+    return parser.parse_args()
+
+def main():
+    args = parse_cli_args()
+    # The tree walker recurses once per statement of a sequence
+    sys.setrecursionlimit(100000)
+    if args.suite:
+        sys.exit(run_suite(args))
+    if args.lex:
+        source = corpus(args.sourcefile, args.size)
+        report(bench_lexers(source, args.lexer or list(LEXERS), args.n), 'lexer', len(source))
+        return
+    if args.parse:
+        source = corpus(args.sourcefile, args.size)
+        report(bench_parser(source, args.lexer or list(LEXERS), args.n), 'lexer', len(source))
+        return
+    report(bench_engines(args.sourcefile, args.engine or list(ENGINES), args.n))
+
+if __name__ == '__main__':
+    main()
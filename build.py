@@ -0,0 +1,101 @@
+import hashlib
+import os
+import shlex
+import subprocess
+import time
+
+######################################
+# NATIVE BUILDS OF TRANSPILED NIM
+######################################
+
+# Every module gets its own directory in the cache, one per profile, holding Nim's build cache, the
+# executable and a stamp with the hash of what it was built from. A build whose .nim and compiler
+# command hash to the stamp is skipped.
+
+PROFILES = {
+    'debug': [],
+    'release': ['-d:release'],
+    'danger': ['-d:danger'],
+}
+
+def default_compiler():
+    return os.environ.get('SOUL_NIM', 'nim')
+
+def default_cache_dir():
+    if 'SOUL_CACHE' in os.environ:
+        return os.environ['SOUL_CACHE']
+    return os.path.join(os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache'), 'soul')
+
+class BuildError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.status = status
+
+class Builder:
+    def __init__(self, compiler=None, profile='debug', cache_dir=None):
+        # The compiler is a command line, `nim` or `python3 stubnim.py` alike
+        self.compiler = shlex.split(compiler or default_compiler())
+        self.profile = profile
+        self.cache_dir = cache_dir or default_cache_dir()
+
+    def directory(self, nim_path):
+        path = os.path.abspath(nim_path)
+        name = os.path.splitext(os.path.basename(path))[0]
+        key = hashlib.sha256(path.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f'{name}-{key}', self.profile)
+
+    def executable(self, nim_path):
+        name = os.path.splitext(os.path.basename(nim_path))[0]
+        return os.path.join(self.directory(nim_path), name + ('.exe' if os.name == 'nt' else ''))
+
+    def command(self, nim_path):
+        nimcache = os.path.join(self.directory(nim_path), 'nimcache')
+        return self.compiler + ['c'] + PROFILES[self.profile] + [f'--nimcache:{nimcache}', f'--out:{self.executable(nim_path)}', nim_path]
+
+    def digest(self, nim_path):
+        command = self.command(nim_path)
+        with open(nim_path, 'rb') as f:
+            return hashlib.sha256(f.read() + b'\0' + '\0'.join(command).encode('utf-8')).hexdigest()
+
+    # Builds the executable for nim_path unless it is up to date. Returns the seconds the build took, None when skipped
+    def build(self, nim_path):
+        directory = self.directory(nim_path)
+        executable = self.executable(nim_path)
+        stamp = os.path.join(directory, 'stamp')
+        digest = self.digest(nim_path)
+        try:
+            with open(stamp, 'r') as f:
+                if f.read() == digest and os.path.isfile(executable):
+                    return None
+        except OSError:
+            pass
+        os.makedirs(directory, exist_ok=True)
+        start = time.time()
+        try:
+            status = subprocess.run(self.command(nim_path)).returncode
+        except OSError as error:
+            raise BuildError(f'BuildError: Could not run {" ".join(self.compiler)}: {error}', 127)
+        if status != 0:
+            raise BuildError(f'BuildError: {" ".join(self.compiler)} failed on {nim_path} with status {status}', status)
+        if not os.path.isfile(executable):
+            raise BuildError(f'BuildError: {" ".join(self.compiler)} did not write {executable}', 1)
+        with open(stamp, 'w') as f:
+            f.write(digest)
+        return time.time() - start
+
+    def run(self, nim_path):
+        return subprocess.run([self.executable(nim_path)]).returncode
+
+# Builds and runs the program transpiled to nim_path, reporting the build time on its own. Returns the exit status
+def build_and_run(nim_path, builder=None):
+    builder = builder or Builder()
+    try:
+        seconds = builder.build(nim_path)
+    except BuildError as error:
+        print(error)
+        return error.status
+    if seconds is None:
+        print(f'Build skipped, {os.path.basename(nim_path)} is unchanged')
+    else:
+        print(f'Built in: {seconds} seconds ({builder.profile})')
+    return builder.run(nim_path)
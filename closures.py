@@ -0,0 +1,393 @@
+from runtime import *
+from lexer import TokenKind
+from ast import *
+from modules import registry
+import profiler
+import tasks
+
+######################################
+# CLOSURE COMPILER (AST -> PYTHON CALLABLES)
+######################################
+
+# EACH ENTRY BUILDS THE CLOSURE FOR ONE OPERATOR, SO NO BRANCHING ON THE OPERATOR IS LEFT AT RUNTIME
+def binop_plus(a, b): return lambda state: a(state) + b(state)
+def binop_minus(a, b): return lambda state: a(state) - b(state)
+def binop_mul(a, b): return lambda state: a(state) * b(state)
+def binop_div(a, b): return lambda state: a(state) / b(state)
+def binop_eq(a, b): return lambda state: a(state) == b(state)
+def binop_neq(a, b): return lambda state: a(state) != b(state)
+def binop_great(a, b): return lambda state: a(state) > b(state)
+def binop_less(a, b): return lambda state: a(state) < b(state)
+def binop_in(a, b): return lambda state: a(state) in b(state)
+def binop_ge(a, b): return lambda state: a(state) >= b(state)
+def binop_le(a, b): return lambda state: a(state) <= b(state)
+def binop_or(a, b): return lambda state: a(state) or b(state)
+def binop_and(a, b): return lambda state: a(state) and b(state)
+def binop_dot(a, b):
+    def dot(state):
+        name = b(state)
+        obj = a(state)
+        # NOTE: Enums are accessed by doing: (x being an enum with atribute Y) x."Y"
+        try:
+            return getattr(obj, name)
+        except:
+            return obj[name]
+    return dot
+
+# THE SAME OPERATORS WITH A CONSTANT RIGHT HAND SIDE BAKED IN
+def const_plus(a, c): return lambda state: a(state) + c
+def const_minus(a, c): return lambda state: a(state) - c
+def const_mul(a, c): return lambda state: a(state) * c
+def const_div(a, c): return lambda state: a(state) / c
+def const_eq(a, c): return lambda state: a(state) == c
+def const_neq(a, c): return lambda state: a(state) != c
+def const_great(a, c): return lambda state: a(state) > c
+def const_less(a, c): return lambda state: a(state) < c
+def const_ge(a, c): return lambda state: a(state) >= c
+def const_le(a, c): return lambda state: a(state) <= c
+
+BINOPS = {
+    TokenKind.PLUS: binop_plus,
+    TokenKind.MINUS: binop_minus,
+    TokenKind.MUL: binop_mul,
+    TokenKind.DIV: binop_div,
+    TokenKind.EQ: binop_eq,
+    TokenKind.NEQ: binop_neq,
+    TokenKind.GREAT: binop_great,
+    TokenKind.LESS: binop_less,
+    TokenKind.IN: binop_in,
+    TokenKind.GE: binop_ge,
+    TokenKind.LE: binop_le,
+    TokenKind.OR: binop_or,
+    TokenKind.AND: binop_and,
+    TokenKind.DOT: binop_dot,
+}
+
+CONST_BINOPS = {
+    TokenKind.PLUS: const_plus,
+    TokenKind.MINUS: const_minus,
+    TokenKind.MUL: const_mul,
+    TokenKind.DIV: const_div,
+    TokenKind.EQ: const_eq,
+    TokenKind.NEQ: const_neq,
+    TokenKind.GREAT: const_great,
+    TokenKind.LESS: const_less,
+    TokenKind.GE: const_ge,
+    TokenKind.LE: const_le,
+}
+
+CONSTANTS = {
+    "NumExpr": lambda node: node.val,
+    "String": lambda node: node.string,
+    "TrueNode": lambda node: True,
+    "FalseNode": lambda node: False,
+    "NoneNode": lambda node: None,
+    "Comment": lambda node: None,
+}
+
+class ClosureCompiler:
+    def __init__(self, subject=None):
+        self.subject = subject
+
+    def compile(self, node):
+        return getattr(self, "compile_"+type(node).__name__, self.compile_fallback)(node)
+
+    def compile_fallback(self, node):
+        subject = self.subject
+        def fallback(state):
+            return node.eval(state, subject)
+        return fallback
+
+    def constant(self, node):
+        value = CONSTANTS[type(node).__name__](node)
+        return lambda state: value
+
+    compile_NumExpr = constant
+    compile_String = constant
+    compile_TrueNode = constant
+    compile_FalseNode = constant
+    compile_NoneNode = constant
+    compile_Comment = constant
+
+    def compile_SequenceNode(self, node):
+        # FLATTEN THE LEFT DEEP CHAIN SO LONG PROGRAMS DO NOT NEST ONE CALL PER STATEMENT
+        statements = []
+        while type(node) == SequenceNode:
+            statements.append(node.second)
+            node = node.first
+        statements.append(node)
+        statements.reverse()
+        body = tuple(self.compile(s) for s in statements[:-1] if type(s) != Comment)
+        last = self.compile(statements[-1])
+        if len(body) == 1:
+            first = body[0]
+            def sequence(state):
+                first(state)
+                return last(state)
+        else:
+            def sequence(state):
+                for statement in body:
+                    statement(state)
+                return last(state)
+        return sequence
+
+    def compile_VarExpr(self, node):
+        name = node.name
+        if node.slot is None:
+            def var(state):
+                value = state.vals.get(name, UNBOUND)
+                if value is UNBOUND:
+                    return state.lookup(name)
+                return value
+            return var
+        (depth, slot) = node.slot
+        if slot is None:
+            def var(state):
+                for _ in range(depth):
+                    state = state.parent
+                return state.lookup(name)
+        elif depth == 0:
+            def var(state):
+                value = state.slots[slot]
+                if value is UNBOUND:
+                    return state.parent.lookup(name)
+                return value
+        else:
+            def var(state):
+                for _ in range(depth):
+                    state = state.parent
+                value = state.slots[slot]
+                if value is UNBOUND:
+                    return state.parent.lookup(name)
+                return value
+        return var
+
+    def compile_Assign(self, node):
+        name = node.var
+        value = self.compile(node.assignment)
+        if node.slot is None:
+            def assign(state):
+                v = value(state)
+                state.bind(name, v)
+                return (type(v), name)
+        else:
+            slot = node.slot[1]
+            def assign(state):
+                v = value(state)
+                state.slots[slot] = v
+                return (type(v), name)
+        return assign
+
+    def compile_AlgerbraicVariable(self, node):
+        name = node.var
+        def alg(state):
+            state.bind(name, None)
+        return alg
+
+    def compile_AlgebraicCalling(self, node):
+        name = node.name
+        def alcall(state):
+            state.lookup(name)
+        return alcall
+
+    def compile_Print(self, node):
+        data = self.compile(node.data)
+        def print_(state):
+            value = data(state)
+            if value is not None:
+                print(value)
+        return print_
+
+    def compile_Echo(self, node):
+        return self.compile(node.data)
+
+    def compile_Await(self, node):
+        value = self.compile(node.value)
+        wait = tasks.wait
+        return lambda state: wait(value(state))
+
+    def compile_Spawn(self, node):
+        value = self.compile(node.value)
+        spawn = tasks.spawn
+        return lambda state: spawn(value(state))
+
+    def compile_InputNode(self, node):
+        prompt = self.compile(node.prompt)
+        return lambda state: input(prompt(state))
+
+    def compile_AssertNode(self, node):
+        value = self.compile(node.value)
+        def assert_(state):
+            assert value(state)
+        return assert_
+
+    def compile_RaiseNode(self, node):
+        value = self.compile(node.value)
+        def raise_(state):
+            raise value(state)
+        return raise_
+
+    def compile_ReturnNode(self, node):
+        value = self.compile(node.value)
+        def return_(state):
+            raise EarlyReturn(value(state))
+        return return_
+
+    def compile_BreakNode(self, node):
+        value = self.compile(node.value)
+        def break_(state):
+            raise EarlyBreak(value(state))
+        return break_
+
+    def compile_InitNode(self, node):
+        value = self.compile(node.value)
+        def init(state):
+            state.bind("self", value(state))
+            try:
+                state.lookup("self")()
+            except:
+                state.lookup("self")
+        return init
+
+    def compile_BinOp(self, node):
+        if node.op in CONST_BINOPS and type(node.second).__name__ in CONSTANTS:
+            return CONST_BINOPS[node.op](self.compile(node.first), CONSTANTS[type(node.second).__name__](node.second))
+        if node.op in BINOPS:
+            return BINOPS[node.op](self.compile(node.first), self.compile(node.second))
+        return self.compile_fallback(node)
+
+    def compile_IfExpr(self, node):
+        cond = self.compile(node.cond)
+        left = self.compile(node.left)
+        if node.right == None:
+            def if_(state):
+                if cond(state):
+                    return left(state)
+        else:
+            right = self.compile(node.right)
+            def if_(state):
+                if cond(state):
+                    return left(state)
+                return right(state)
+        return if_
+
+    def compile_WhileExpr(self, node):
+        cond = self.compile(node.cond)
+        left = self.compile(node.left)
+        if node.ret == None:
+            def while_(state):
+                try:
+                    while cond(state):
+                        left(state)
+                except EarlyBreak as EB:
+                    return EB.value
+        elif node.ret == "yield":
+            def stream(state):
+                try:
+                    while cond(state):
+                        yield left(state)
+                except (EarlyBreak, EarlyReturn):
+                    return
+            def while_(state):
+                return Stream(stream(state))
+        else:
+            def while_(state):
+                x = []
+                try:
+                    while cond(state):
+                        x.append(left(state))
+                except EarlyBreak as EB:
+                    return EB.value
+                return x
+        return while_
+
+    def compile_Call(self, node):
+        if type(node.func) == str:
+            func = self.compile(VarExpr(None, node.func))
+        else:
+            func = self.compile(node.func)
+        args = tuple(self.compile(arg) for arg in node.args)
+        subject = self.subject
+        def not_callable():
+            raise SyntaxError(f"FunctionCallError: The identifier {node.func} does not belong to a function. {where(subject, node.offset)}")
+        if node.tail:
+            # Hand the call back to the trampoline of the enclosing function
+            def call(state):
+                function = func(state)
+                if callable(function):
+                    return TailCall(function, [arg(state) for arg in args])
+                not_callable()
+        elif len(args) == 0:
+            def call(state):
+                function = func(state)
+                if callable(function):
+                    return function()
+                not_callable()
+        elif len(args) == 1:
+            (arg,) = args
+            def call(state):
+                function = func(state)
+                if callable(function):
+                    return function(arg(state))
+                not_callable()
+        else:
+            def call(state):
+                function = func(state)
+                if callable(function):
+                    return function(*[arg(state) for arg in args])
+                not_callable()
+        return call
+
+    def compile_FunctionNode(self, node):
+        name = node.name
+        return_type = node.return_type
+        body = self.compile(node.body)
+        subject = self.subject
+        enter = node.enter
+        def function(state):
+            def call_fn(*args):
+                state_copy = enter(state, args, subject)
+                try:
+                    return body(state_copy)
+                except EarlyReturn as ER:
+                    if return_type != "any" and type(ER.value) != return_type.eval(state, subject):
+                        raise TypeReturnNode(f"Function did not return type specified. {where(subject, node.offset)}")
+                    return ER.value
+            call_fn = profiler.wrap(name, call_fn)
+            if node.tail_calls:
+                bounce = call_fn
+                def call_fn(*args):
+                    return trampoline(bounce(*args))
+                call_fn.bounce = bounce
+            if node.memo is not None:
+                call_fn = Memo(call_fn, node.memo, name)
+            if node.asynchronous:
+                call_fn = tasks.AsyncFunction(call_fn, name)
+            state.bind(name, call_fn)
+        return function
+
+    def compile_TryExceptNode(self, node):
+        left = self.compile(node.left)
+        right = self.compile(node.right)
+        specified = None if node.specified == None else node.specified.data
+        def try_(state):
+            try:
+                return left(state)
+            except (EarlyReturn, EarlyBreak):
+                raise
+            except Exception as error:
+                if specified is not None:
+                    kind = state.lookup(specified)
+                    if not (isinstance(kind, type) and isinstance(error, kind)):
+                        raise
+                return right(state)
+        return try_
+
+    def compile_Run(self, node):
+        if node.c != None:
+            return self.compile_fallback(node)
+        def module(tree, namespace, lines):
+            return ClosureCompiler(lines).compile(tree)(namespace)
+        def run(state):
+            return registry.import_into(node.file, state, module)
+        return run
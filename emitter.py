@@ -0,0 +1,214 @@
+from contextlib import contextmanager
+from ast import *
+from infer import ModuleTypes, StatementTypes, VOID, nim_type
+
+######################################
+# STREAMING NIM EMITTER
+######################################
+
+# Statements and blocks are written line by line to a NimWriter, which keeps the indentation as a stack and hands
+# what it collected to the output file in chunks, so nothing is ever concatenated per statement. Expressions are
+# short and still come from each node's compile(), statements that can not be transpiled run at compile time.
+# Every top level statement is typed by infer.py right before it is written.
+
+class NimWriter:
+    def __init__(self, out, limit=1 << 16):
+        self.out = out
+        # Characters collected before they are written out
+        self.limit = limit
+        self.parts = []
+        self.size = 0
+        self.indents = [""]
+        # Statements being written, nothing is handed to the output until the outermost one is done
+        self.pending = 0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= self.limit and not self.pending:
+            self.flush()
+
+    @contextmanager
+    def statement(self):
+        # What a statement wrote is dropped again if it fails halfway, a proc is never left without its body
+        mark = (len(self.parts), self.size)
+        self.pending += 1
+        try:
+            yield
+        except BaseException:
+            del self.parts[mark[0]:]
+            self.size = mark[1]
+            raise
+        finally:
+            self.pending -= 1
+        if self.size >= self.limit and not self.pending:
+            self.flush()
+
+    def line(self, text):
+        indent = self.indents[-1]
+        for line in text.split("\n"):
+            self.write(indent + line + "\n")
+
+    @contextmanager
+    def indent(self):
+        self.indents.append(self.indents[-1] + "    ")
+        try:
+            yield
+        finally:
+            self.indents.pop()
+
+    def flush(self):
+        self.out.write("".join(self.parts))
+        self.parts.clear()
+        self.size = 0
+
+class NimEmitter:
+    def __init__(self, writer, state, subject, types=None):
+        self.writer = writer
+        self.state = state
+        self.subject = subject
+        # What the module declared so far, and the types of the statement being written
+        self.types = types or ModuleTypes()
+        self.typed = StatementTypes(self.types)
+        # Statements that ran at compile time instead of being transpiled
+        self.evaluated = 0
+
+    def emit_module(self, tree):
+        statements = []
+        while type(tree) == SequenceNode:
+            statements.append(tree.second)
+            tree = tree.first
+        statements.append(tree)
+        for statement in reversed(statements):
+            self.typed = self.types.statement(statement)
+            for line in self.typed.hoisted:
+                self.writer.line(line)
+            self.emit(statement)
+
+    def emit(self, node):
+        if getattr(node, "cmpt", None) is not None:
+            self.evaluated += 1
+            emit = self.emit_fallback
+        else:
+            emit = getattr(self, "emit_"+type(node).__name__, self.emit_fallback)
+        try:
+            with self.writer.statement():
+                emit(node)
+        except (EarlyReturn, EarlyBreak):
+            raise
+        except Exception:
+            # The writer dropped what the statement wrote, it runs at compile time instead
+            self.evaluated += 1
+            node.eval(self.state, self.subject)
+
+    def expr(self, node):
+        if node in self.typed.concats:
+            return self.expr(node.first)+" & "+self.expr(node.second)
+        return node.compile(self.state, self.subject, 0)
+
+    def emit_fallback(self, node):
+        text = node.compile(self.state, self.subject, 0)
+        # None is what compile time nodes give back once they have run
+        if text is not None:
+            self.writer.line(str(text))
+
+    def emit_SequenceNode(self, node):
+        statements = []
+        while type(node) == SequenceNode:
+            statements.append(node.second)
+            node = node.first
+        statements.append(node)
+        for statement in reversed(statements):
+            self.emit(statement)
+
+    def emit_Comment(self, node):
+        pass
+
+    def emit_Print(self, node):
+        self.writer.line("echo "+self.expr(node.data))
+
+    def emit_Assign(self, node):
+        (declares, t) = self.typed.assigns.get(node, (True, None))
+        if declares is None:
+            raise TypeError(f"{node.var} has no type to declare it with before the block it is first assigned in")
+        if type(node.assignment) == WhileExpr:
+            if node.assignment.ret == None:
+                # Its value is what it breaks with, which no Nim expression gives
+                raise TypeError("A while loop without ret has no value in Nim")
+            # The loop collects straight into the variable
+            return self.emit_collect(node.assignment, node.var, declares)
+        value = self.expr(node.assignment)
+        if not declares:
+            self.writer.line(node.var+" = "+value)
+        elif t is None:
+            self.writer.line("var "+node.var+" = "+value)
+        else:
+            self.writer.line("var "+node.var+": "+t+" = "+value)
+
+    def emit_ReturnNode(self, node):
+        self.writer.line("return "+self.expr(node.value))
+
+    def emit_BreakNode(self, node):
+        self.writer.line("break")
+
+    def emit_FunctionNode(self, node):
+        (params, result, hoisted) = self.typed.procs.get(node, ([(name, None) for name in node.params], None, []))
+        params = ", ".join(name+": "+(nim_type(t) or "auto") for (name, t) in params)
+        if result == VOID:
+            self.writer.line("proc "+node.name+"("+params+") =")
+        else:
+            self.writer.line("proc "+node.name+"("+params+"): "+(nim_type(result) or "auto")+" =")
+        with self.writer.indent():
+            for line in hoisted:
+                self.writer.line(line)
+            self.emit(node.body)
+
+    def emit_IfExpr(self, node):
+        self.writer.line("if "+self.expr(node.cond)+":")
+        with self.writer.indent():
+            self.emit(node.left)
+        if node.right != None:
+            self.writer.line("else:")
+            with self.writer.indent():
+                self.emit(node.right)
+
+    def emit_WhileExpr(self, node):
+        if node.ret != None:
+            self.emit_collect(node, "ret", True)
+            self.writer.line("ret")
+            return
+        self.writer.line("while "+self.expr(node.cond)+":")
+        with self.writer.indent():
+            self.emit(node.left)
+
+    def emit_collect(self, node, target, declares):
+        # while ret collects the value every pass ends with
+        cond = self.expr(node.cond)
+        body = node.left
+        last = body.second if type(body) == SequenceNode else body
+        last = self.expr(last)
+        t = self.typed.loops.get(node)
+        if not declares:
+            self.writer.line(target+" = @[]")
+        elif t is None:
+            self.writer.line("var "+target+" = @[]")
+        else:
+            self.writer.line("var "+target+": seq["+t+"] = @[]")
+        self.writer.line("while "+cond+":")
+        with self.writer.indent():
+            if type(body) == SequenceNode:
+                self.emit(body.first)
+            self.writer.line(target+".add("+last+")")
+
+    def emit_TryExceptNode(self, node):
+        self.writer.line("try:")
+        with self.writer.indent():
+            self.emit(node.left)
+        self.writer.line("except:" if node.specified == None else f"except {node.specified.data}:")
+        with self.writer.indent():
+            self.emit(node.right)
+
+def transpile(tree, out, state, subject):
+    writer = NimWriter(out)
+    NimEmitter(writer, state, subject).emit_module(tree)
+    writer.flush()
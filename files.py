@@ -0,0 +1,151 @@
+import mmap
+import os
+from runtime import builtin, Stream
+
+######################################
+# FILE BUILTINS
+######################################
+
+# Files of any size are read a line or a chunk at a time as streams, or mapped read-only with map_file, where the
+# operating system pages in what is looked at and nothing is copied until it is sliced out. Writes go through a
+# large buffer, and write_lines hands a whole stream to it without joining it into one string first. Builtins that
+# take a source or target take a path, which they open and close themselves, or a file from open_file.
+
+BUFFER = 1 << 20
+
+@builtin
+def open_file(path, mode="r"):
+    if "b" in mode:
+        return open(path, mode, buffering=BUFFER)
+    return open(path, mode, buffering=BUFFER, encoding="utf-8", newline="")
+
+@builtin
+def close_file(file):
+    file.close()
+
+def opened(source, mode="r"):
+    # The file source names and whether it is ours to close
+    if isinstance(source, (str, os.PathLike)):
+        return (open_file(source, mode), True)
+    return (source, False)
+
+def each_line(source):
+    (file, owned) = opened(source)
+    try:
+        for line in file:
+            yield line.rstrip("\r\n") if type(line) is str else line.rstrip(b"\r\n")
+    finally:
+        if owned:
+            file.close()
+
+def each_chunk(source, size):
+    (file, owned) = opened(source)
+    try:
+        while True:
+            chunk = file.read(size)
+            if not chunk:
+                return
+            yield chunk
+    finally:
+        if owned:
+            file.close()
+
+@builtin
+def lines(source):
+    # The lines of source without their line breaks, read as they are asked for
+    return Stream(each_line(source))
+
+@builtin
+def chunks(source, size=BUFFER):
+    # source read size characters (bytes for a file opened with "rb") at a time
+    if size <= 0:
+        raise ValueError(f"chunks needs a size above 0, not {size}")
+    return Stream(each_chunk(source, size))
+
+@builtin
+def write_lines(target, values):
+    # Writes every value of a list or stream on a line of its own, returns how many were written
+    (file, owned) = opened(target, "w")
+    count = 0
+    def numbered():
+        nonlocal count
+        for value in values:
+            count += 1
+            yield f"{value}\n"
+    try:
+        file.writelines(numbered())
+    finally:
+        if owned:
+            file.close()
+    return count
+
+@builtin
+def write_text(target, text):
+    (file, owned) = opened(target, "w")
+    try:
+        return file.write(text)
+    finally:
+        if owned:
+            file.close()
+
+class FileView:
+    # A file mapped read-only. Indexes are byte offsets, slices decode only the bytes they cover
+    __slots__ = ("path", "map")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            # An empty file can not be mapped, and has nothing to look at anyway
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else None
+
+    def __repr__(self):
+        return f"<view {self.path}, {len(self)} bytes>"
+
+    def __len__(self):
+        return 0 if self.map is None else len(self.map)
+
+    def __getitem__(self, index):
+        if self.map is None:
+            return "" if type(index) is slice else b""[index]
+        if type(index) is slice:
+            return self.map[index].decode("utf-8", "replace")
+        return chr(self.map[index])
+
+    def __contains__(self, text):
+        return self.find(text) != -1
+
+    def find(self, text, start=0):
+        if self.map is None:
+            return -1
+        return self.map.find(text.encode("utf-8") if type(text) is str else text, start)
+
+    def lines(self):
+        if self.map is None:
+            return
+        # Offsets of its own, so several streams can go over one view at once
+        position = 0
+        end = len(self.map)
+        data = self.map
+        while position < end:
+            stop = data.find(b"\n", position)
+            if stop == -1:
+                stop = end
+            yield data[position:stop].rstrip(b"\r").decode("utf-8", "replace")
+            position = stop + 1
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+
+@builtin
+def map_file(path):
+    return FileView(path)
+
+@builtin
+def map_lines(view):
+    return Stream(view.lines())
+
+@builtin
+def map_find(view, text, start=0):
+    # The byte offset of the first text at or after start, -1 if there is none
+    return view.find(text, start)
@@ -0,0 +1,143 @@
+import hashlib
+import io
+import marshal
+import os
+import re
+from ast import *
+from lexer import LineIndex, TokenList, tokenize
+from sparser import Parser
+import soulc
+from optimizer import optimize
+from resolver import children
+from emitter import NimWriter, NimEmitter
+from infer import ModuleTypes
+
+######################################
+# INCREMENTAL TRANSPILING (.soulm FILES)
+######################################
+
+# A .soulm file maps the sha256 of the text of each top level statement of a module to the Nim it was transpiled to,
+# along with the types of the names it read from the statements before it and of those it declared for the ones after.
+# A scan for brackets and semicolons finds where the statements end, and only statements whose text is not in the
+# manifest, or which read a name whose type changed since, are lexed, parsed and emitted. Statements that run anything
+# at compile time are emitted every time and never stored, the others never run at compile time, reused or not.
+# Bump VERSION whenever the emitter changes what it writes.
+VERSION = soulc.VERSION + ' nim 3'
+
+# Only what can hide or end a statement: strings and comments, brackets, semicolons. The rest is skipped
+BOUNDARIES = re.compile(r"""
+    "[^"]*" | '[^']*' | \|[^|]*\|
+  | (?P<unterminated>["'|])
+  | (?P<open>[{(\[])
+  | (?P<close>[})\]])
+  | (?P<end>;)
+""", re.VERBOSE)
+
+# Nodes whose compile() reads or changes the compile time state
+IMPURE = ("Run", "InitNode", "Echo", "AlgerbraicVariable", "AlgebraicCalling")
+
+class Statement:
+    def __init__(self, source, start, end):
+        self.start = start
+        self.end = end
+        self.key = hashlib.sha256(source[start:end].strip().encode('utf-8')).digest()
+
+# The top level statements of source, split at the semicolons outside any brackets, without lexing them
+def statements(source):
+    found = []
+    depth = 0
+    start = 0
+    for m in BOUNDARIES.finditer(source):
+        group = m.lastgroup
+        if group == 'open':
+            depth += 1
+        elif group == 'close':
+            depth -= 1
+        elif group == 'end' and depth == 0:
+            found.append(Statement(source, start, m.start()))
+            start = m.end()
+        elif group == 'unterminated':
+            # Runs to the end of the source, like in the lexer
+            break
+    found.append(Statement(source, start, len(source)))
+    return found
+
+def pure(tree):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if getattr(node, "cmpt", None) is not None or type(node).__name__ in IMPURE:
+            return False
+        stack.extend(children(node))
+    return True
+
+def manifest_path(path):
+    return os.path.splitext(path)[0] + '.soulm'
+
+def load_manifest(path):
+    try:
+        with open(manifest_path(path), 'rb') as f:
+            (version, fragments) = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return {}
+    return fragments if version == VERSION else {}
+
+def save_manifest(path, fragments):
+    manifest = manifest_path(path)
+    temp = f'{manifest}.{os.getpid()}.tmp'
+    try:
+        with open(temp, 'wb') as f:
+            f.write(marshal.dumps((VERSION, fragments)))
+        os.replace(temp, manifest)
+    except OSError:
+        pass
+
+# Transpiles the module read from path into out, reusing the Nim of every statement that did not change.
+# Returns how many statements were reused and how many were emitted
+def transpile_incremental(path, source, out, state, subject):
+    previous = load_manifest(path)
+    fragments = {}
+    lines = LineIndex(source)
+    found = statements(source)
+    if not source[found[-1].start:].strip() and len(found) > 1:
+        # A trailing semicolon ends the last statement instead of starting another one
+        found.pop()
+    writer = NimWriter(out)
+    types = ModuleTypes()
+    reused = 0
+    emitted = 0
+    for statement in found:
+        fragment = fragments.get(statement.key, previous.get(statement.key))
+        if fragment is not None and types.reuse(fragment[1], fragment[2]):
+            writer.write(fragment[0])
+            fragments[statement.key] = fragment
+            reused += 1
+            continue
+        try:
+            parser = Parser(TokenList(source, lines, list(tokenize(source, lines, statement.start, statement.end))))
+            tree = optimize(parser.parse_statements())
+        except Exception:
+            # Out of context the statement may fail differently, parsing everything reports the real error
+            soulc.parse(source)
+            raise
+        buffer = io.StringIO()
+        emitter = NimEmitter(NimWriter(buffer), state, subject, types)
+        try:
+            emitter.emit_module(tree)
+        except Exception:
+            # A statement that can not run at compile time either fails the module, as when it is emitted in one piece.
+            # What was transpiled before it is kept for the next run
+            save_manifest(path, fragments)
+            raise
+        emitter.writer.flush()
+        writer.write(buffer.getvalue())
+        emitted += 1
+        if parser.token is not None or type(tree) in (ReturnNode, BreakNode):
+            # Parsing the whole module stops at the first statement not followed by a semicolon, and the
+            # optimizer drops what follows a return or break
+            break
+        if emitter.evaluated == 0 and pure(tree):
+            fragments[statement.key] = (buffer.getvalue(), emitter.typed.consulted, emitter.typed.declared)
+    writer.flush()
+    save_manifest(path, fragments)
+    return (reused, emitted)
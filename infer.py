@@ -0,0 +1,364 @@
+from ast import *
+from lexer import TokenKind
+from resolver import children
+
+######################################
+# TYPE INFERENCE FOR THE NIM EMITTER
+######################################
+
+# Nim wants a type for every var, param and return. Before the emitter writes a top level statement its names are
+# typed from the annotations in `func f(x: int) int`, the literals they are given and what the operators around
+# them give back, going over each function until nothing changes. Names declared by earlier statements come from
+# the module's table, and the statement keeps which of them it read, so the incremental transpiler can tell whether
+# its Nim still holds. A type that can not be worked out is None, and is left for Nim to infer (`auto`).
+
+NIM_TYPES = {"int": "int", "float": "float", "str": "string", "string": "string", "bool": "bool"}
+
+ARITHMETIC = (TokenKind.PLUS, TokenKind.MINUS, TokenKind.MUL, TokenKind.DIV)
+COMPARISONS = (TokenKind.EQ, TokenKind.NEQ, TokenKind.GREAT, TokenKind.LESS, TokenKind.GE, TokenKind.LE)
+LOGIC = (TokenKind.IN, TokenKind.AND, TokenKind.OR)
+CONCRETE = ("int", "float", "string", "bool")
+
+# The value of what gives none (print, var, a loop) and of what has none yet: a call to a function still being
+# typed, a return, a variable read before its first assignment was typed
+VOID = "void"
+PENDING = "pending"
+# What the module table holds for a name no statement declared
+UNDECLARED = "undeclared"
+
+# Statements whose value a function returns or which do not give one
+NO_VALUE = ("Print", "Assign", "FunctionNode", "Comment", "AssertNode", "Run", "AlgerbraicVariable")
+
+MAX_ROUNDS = 8
+
+def join(types):
+    found = set(types)
+    found.discard(PENDING)
+    if not found:
+        return PENDING
+    if None in found:
+        return None
+    if len(found) == 1:
+        return found.pop()
+    if found == {"int", "float"}:
+        return "float"
+    return None
+
+def annotation(name):
+    name = str(name)
+    return NIM_TYPES.get(name, name)
+
+def nim_type(t):
+    # Function values and whatever is still open are left to Nim
+    if type(t) != str or t in (VOID, PENDING, UNDECLARED):
+        return None
+    return t
+
+def proc_type(t):
+    return type(t) == tuple and t[0] == "proc"
+
+
+def sequence(node):
+    flat = []
+    while type(node) == SequenceNode:
+        flat.append(node.second)
+        node = node.first
+    flat.append(node)
+    flat.reverse()
+    return flat
+
+class Frame:
+    # The names one function binds, or the module's for a top level statement
+    def __init__(self, parent, params):
+        self.parent = parent
+        self.params = params
+        self.locals = {}
+        # Declarations the body starts with
+        self.hoisted = []
+
+    def lookup(self, name):
+        if name in self.locals:
+            return self.locals[name]
+        if name in self.params:
+            return self.params[name]
+        return self.parent.lookup(name)
+
+class StatementTypes(Frame):
+    def __init__(self, module):
+        super().__init__(None, {})
+        self.module = module
+        # Names of the module read by the statement, with what they were at the time
+        self.consulted = {}
+        # Function -> (params as (name, type), result, declarations its body starts with)
+        self.procs = {}
+        # Assign -> (whether it declares the variable, its type)
+        self.assigns = {}
+        # while ret -> the type of what it collects
+        self.loops = {}
+        # The + of strings, which Nim writes &
+        self.concats = set()
+
+    # What the statement declares for the statements after it
+    @property
+    def declared(self):
+        return self.locals
+
+    def lookup(self, name):
+        if name in self.locals:
+            return self.locals[name]
+        t = self.module.globals.get(name, UNDECLARED)
+        self.consulted.setdefault(name, t)
+        return None if t == UNDECLARED else t
+
+    def declared_before(self, name):
+        self.lookup(name)
+        return self.consulted[name] != UNDECLARED and name not in self.locals
+
+class Inference:
+    def __init__(self, statement):
+        self.statement = statement
+        self.scans = {}
+        # Whether a type still being worked out was read, which takes another round
+        self.unsettled = False
+
+    def type_of(self, node, frame):
+        t = type(node).__name__
+        if t == "NumExpr":
+            return "float" if type(node.val) == float else "int"
+        if t == "String" or t == "InputNode":
+            return "string"
+        if t == "TrueNode" or t == "FalseNode":
+            return "bool"
+        if t == "VarExpr":
+            found = frame.lookup(node.name)
+            if found == PENDING or (proc_type(found) and found[2] == PENDING):
+                self.unsettled = True
+            return found
+        if t == "BinOp":
+            if node.op in COMPARISONS or node.op in LOGIC:
+                return "bool"
+            if node.op not in ARITHMETIC:
+                return None
+            operands = join([self.type_of(node.first, frame), self.type_of(node.second, frame)])
+            if node.op == TokenKind.DIV and operands in ("int", "float"):
+                return "float"
+            if operands == "string" and node.op == TokenKind.PLUS:
+                self.statement.concats.add(node)
+                return operands
+            if operands in ("int", "float", PENDING):
+                return operands
+            return None
+        if t == "Call":
+            function = self.type_of(node.func, frame)
+            if proc_type(function):
+                return function[2]
+            return PENDING if function == PENDING else None
+        if t == "IfExpr":
+            if node.right == None:
+                return VOID
+            return join([self.value_of(node.left, frame), self.value_of(node.right, frame)])
+        if t == "WhileExpr" and node.ret != None:
+            last = self.type_of(sequence(node.left)[-1], frame)
+            return "seq["+last+"]" if nim_type(last) else None
+        return None
+
+    # The type of what a block ends with
+    def value_of(self, node, frame):
+        t = type(node).__name__
+        if t == "SequenceNode":
+            return self.value_of(node.second, frame)
+        if t in ("ReturnNode", "BreakNode", "RaiseNode"):
+            # Leaves the block, its value goes elsewhere
+            return PENDING
+        if t == "IfExpr":
+            if node.right == None:
+                return VOID
+            return join([self.value_of(node.left, frame), self.value_of(node.right, frame)])
+        if t == "TryExceptNode":
+            return join([self.value_of(node.left, frame), self.value_of(node.right, frame)])
+        if t in NO_VALUE or (t == "WhileExpr" and node.ret == None):
+            return VOID
+        return self.type_of(node, frame)
+
+    def scan(self, body):
+        # The nodes of the body the rounds look at in source order, without those of the functions defined in it
+        scan = self.scans.get(id(body))
+        if scan is None:
+            scan = self.scans[id(body)] = {Assign: [], FunctionNode: [], BinOp: [], Call: [], ReturnNode: [], WhileExpr: []}
+            stack = [body]
+            while stack:
+                node = stack.pop()
+                t = type(node)
+                if t in scan:
+                    scan[t].append(node)
+                if t != FunctionNode:
+                    stack.extend(reversed(list(children(node))))
+        return scan
+
+    def body(self, frame, body):
+        # Types the variables of body and the functions defined in it, inside frame
+        scan = self.scan(body)
+        names = {}
+        for node in scan[Assign]:
+            if node.var not in frame.params:
+                names.setdefault(node.var, []).append(node)
+        for name in names:
+            # Variables the statements before declared keep their type
+            if type(frame) != StatementTypes or not frame.declared_before(name):
+                frame.locals.setdefault(name, PENDING)
+        for _ in range(MAX_ROUNDS):
+            before = dict(frame.locals)
+            for (name, nodes) in names.items():
+                if name in frame.locals:
+                    frame.locals[name] = join([frame.locals[name]] + [self.type_of(node.assignment, frame) for node in nodes])
+            for function in scan[FunctionNode]:
+                frame.locals[function.name] = self.function(function, frame)
+            if frame.locals == before or (not names and len(scan[FunctionNode]) < 2):
+                break
+
+    def uses(self, body):
+        # Every assignment and read of each name in body, with the blocks it is in, outermost first
+        found = {}
+        stack = [(body, ())]
+        while stack:
+            (node, blocks) = stack.pop()
+            t = type(node)
+            if t == Assign:
+                found.setdefault(node.var, []).append((node, blocks))
+            elif t == VarExpr:
+                found.setdefault(node.name, []).append((node, blocks))
+            if t == FunctionNode:
+                continue
+            for child in children(node):
+                if t in (IfExpr, WhileExpr, TryExceptNode) and (child is node.left or child is getattr(node, "right", None)):
+                    stack.append((child, blocks + (id(child),)))
+                else:
+                    stack.append((child, blocks))
+        return found
+
+    def declare(self, frame, body):
+        # A variable first assigned in the body itself is declared there, one first assigned in a nested block
+        # is declared before the body so it outlives the block, like it does in Soul. Without a type it can only be
+        # declared in its block, which must then hold every use of it, or the assignment is not transpiled at all
+        scan = self.scan(body)
+        direct = set(id(node) for node in sequence(body))
+        seen = set()
+        uses = None
+        for node in scan[Assign]:
+            name = node.var
+            t = nim_type(frame.locals.get(name, frame.params.get(name)))
+            if name in seen:
+                self.statement.assigns[node] = (False, t)
+                continue
+            seen.add(name)
+            if name in frame.params:
+                # Nim params can not be assigned to
+                frame.hoisted.append(f"var {name} = {name}")
+                self.statement.assigns[node] = (False, t)
+            elif type(frame) == StatementTypes and name not in frame.locals:
+                self.statement.assigns[node] = (False, t)
+            elif id(node) in direct:
+                self.statement.assigns[node] = (True, t)
+            elif t is None:
+                if uses is None:
+                    uses = self.uses(body)
+                mine = next(blocks for (use, blocks) in uses[name] if use is node)
+                confined = all(blocks[:len(mine)] == mine for (_, blocks) in uses[name])
+                # None: where Nim could declare it, it would not be seen everywhere Soul uses it
+                self.statement.assigns[node] = (True if confined else None, t)
+            else:
+                frame.hoisted.append(f"var {name}: {t}")
+                self.statement.assigns[node] = (False, t)
+        for node in scan[WhileExpr]:
+            if node.ret != None:
+                self.statement.loops[node] = nim_type(self.type_of(sequence(node.left)[-1], frame))
+
+    def constrain(self, node, frame, params, constraints):
+        # What the uses of the untyped params in the body say about them
+        scan = self.scan(node.body)
+        names = list(params)
+        for inner in scan[BinOp]:
+            if inner.op in ARITHMETIC or inner.op in COMPARISONS:
+                for (mine, other) in ((inner.first, inner.second), (inner.second, inner.first)):
+                    if type(mine) == VarExpr and mine.name in constraints and mine.name not in frame.locals:
+                        other = self.type_of(other, frame)
+                        if other in CONCRETE:
+                            constraints[mine.name].append(other)
+        for inner in scan[Call]:
+            if type(inner.func) != VarExpr:
+                continue
+            function = self.type_of(inner.func, frame)
+            if not proc_type(function):
+                continue
+            own = inner.func.name == node.name and inner.func.name not in frame.locals
+            for (position, arg) in enumerate(inner.args[:len(function[1])]):
+                if own and names[position] in constraints:
+                    # What the function passes itself says what its params are
+                    argument = self.type_of(arg, frame)
+                    if argument in CONCRETE:
+                        constraints[names[position]].append(argument)
+                if type(arg) == VarExpr and arg.name in constraints and function[1][position] in CONCRETE:
+                    constraints[arg.name].append(function[1][position])
+        for inner in scan[Assign]:
+            if type(inner.assignment) == VarExpr and inner.assignment.name in constraints:
+                local = frame.locals.get(inner.var)
+                if local in CONCRETE:
+                    constraints[inner.assignment.name].append(local)
+
+    def function(self, node, parent):
+        free = [name for (name, t) in node.params.items() if t == "any"]
+        params = {name: (PENDING if t == "any" else annotation(t)) for (name, t) in node.params.items()}
+        frame = Frame(parent, params)
+        annotated = node.return_type != "any"
+        result = annotation(node.return_type) if annotated else PENDING
+        for _ in range(MAX_ROUNDS):
+            before = (dict(params), result)
+            unsettled = self.unsettled
+            self.unsettled = False
+            constraints = {name: [params[name]] for name in free}
+            self.constrain(node, frame, params, constraints)
+            for (name, found) in constraints.items():
+                params[name] = join(found)
+            # Calls to the function from its own body see what it is typed as so far
+            parent.locals[node.name] = ("proc", tuple(params.values()), result)
+            frame.locals = {}
+            self.body(frame, node.body)
+            if not annotated:
+                returns = [self.type_of(inner.value, frame) for inner in self.scan(node.body)[ReturnNode]]
+                tail = self.value_of(node.body, frame)
+                if tail == VOID and returns:
+                    tail = PENDING
+                result = join(returns + [tail])
+            settled = not self.unsettled
+            self.unsettled = unsettled or self.unsettled
+            if settled or (params, result) == before:
+                break
+        self.declare(frame, node.body)
+        params = [(name, None if t == PENDING else t) for (name, t) in params.items()]
+        result = None if result == PENDING else result
+        self.statement.procs[node] = (params, result, frame.hoisted)
+        return ("proc", tuple(t for (_, t) in params), result)
+
+class ModuleTypes:
+    def __init__(self):
+        # Name -> type of everything the statements typed so far declared
+        self.globals = {}
+
+    def statement(self, tree):
+        statement = StatementTypes(self)
+        if tree is not None:
+            inference = Inference(statement)
+            inference.body(statement, tree)
+            inference.declare(statement, tree)
+        for (name, t) in statement.locals.items():
+            statement.locals[name] = None if t == PENDING else t
+        self.globals.update(statement.locals)
+        return statement
+
+    # Whether the Nim written for a statement that read consulted still holds, declaring what it did if so
+    def reuse(self, consulted, declared):
+        for (name, t) in consulted.items():
+            if self.globals.get(name, UNDECLARED) != t:
+                return False
+        self.globals.update(declared)
+        return True
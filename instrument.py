@@ -0,0 +1,211 @@
+import json
+import time
+from collections import Counter
+from contextlib import contextmanager
+from resolver import children
+
+######################################
+# PHASE TIMES AND COUNTERS (--profile)
+######################################
+
+# A profile times the phases of a run and counts what they went through. The counters are methods of the lexer,
+# parser, nodes and engines wrapped only while a profile is recorded, and put back after, so without --profile
+# nothing runs that would not have run anyway. A phase holds the time spent in it minus that of the phases
+# started inside it, an import's parse is parse time and not import time.
+
+COUNTS = ("tokens lexed", "nodes built", "nodes evaluated", "function calls", "imports")
+
+# The profile being recorded, None when there is none
+active = None
+
+class phase:
+    # Times what runs inside it as a phase of the active profile, if any
+    __slots__ = ("name",)
+    def __init__(self, name):
+        self.name = name
+    def __enter__(self):
+        if active is not None:
+            active.enter(self.name)
+    def __exit__(self, *exc):
+        if active is not None:
+            active.exit()
+
+def size(tree):
+    nodes = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        nodes += 1
+        stack.extend(children(node))
+    return nodes
+
+class Profile:
+    def __init__(self):
+        # Phase -> seconds, in the order the phases first ran
+        self.seconds = {}
+        self.counts = Counter({key: 0 for key in COUNTS})
+        # [phase, start, seconds of the phases inside it] of the phases running
+        self.running = []
+        # (owner, attribute, original) of what was wrapped
+        self.patches = []
+        self.total = 0.0
+        self.started = None
+
+    def enter(self, name):
+        self.running.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        (name, start, inner) = self.running.pop()
+        elapsed = time.perf_counter() - start
+        self.seconds[name] = self.seconds.get(name, 0.0) + elapsed - inner
+        if self.running:
+            self.running[-1][2] += elapsed
+
+    def patch(self, owner, name, wrap):
+        original = vars(owner)[name]
+        self.patches.append((owner, name, original))
+        setattr(owner, name, wrap(original))
+
+    def timed(self, name):
+        def wrap(function):
+            def timed(*args, **kwargs):
+                self.enter(name)
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.exit()
+            return timed
+        return wrap
+
+    def counted(self, key):
+        counts = self.counts
+        def wrap(function):
+            def counted(*args, **kwargs):
+                counts[key] += 1
+                return function(*args, **kwargs)
+            return counted
+        return wrap
+
+    def install(self):
+        # ast.py imports this module before most of those it wraps can be
+        import ast, lexer, sparser, soulc, vm, closures, incremental
+        from build import Builder
+        from modules import ModuleRegistry
+        counts = self.counts
+        def lexed(function):
+            def __next__(tokens):
+                self.enter("lex")
+                try:
+                    token = function(tokens)
+                finally:
+                    self.exit()
+                counts["tokens lexed"] += 1
+                return token
+            return __next__
+        def tokenized(function):
+            # The incremental transpiler lexes a statement at once
+            def tokenize(*args):
+                self.enter("lex")
+                try:
+                    tokens = list(function(*args))
+                finally:
+                    self.exit()
+                counts["tokens lexed"] += len(tokens)
+                return tokens
+            return tokenize
+        def loaded(function):
+            # Trees decoded from a .soulc file are built without their __init__
+            def loads(data, source):
+                self.enter("load cache")
+                try:
+                    tree = function(data, source)
+                finally:
+                    self.exit()
+                if tree is not None:
+                    counts["nodes built"] += size(tree)
+                return tree
+            return loads
+        def counting(kind, function):
+            # The VM counts a node when the code compiled for it runs, nodes left to their eval() count themselves
+            def compile(compiler, node):
+                if hasattr(compiler, kind+type(node).__name__):
+                    compiler.emit(vm.COUNT, counts)
+                return function(compiler, node)
+            return compile
+        def wrapping(function):
+            # So does the closure compiler with the closures it makes
+            def compile(compiler, node):
+                closure = function(compiler, node)
+                if not hasattr(compiler, "compile_"+type(node).__name__):
+                    return closure
+                def counted(state):
+                    counts["nodes evaluated"] += 1
+                    return closure(state)
+                return counted
+            return compile
+        self.patch(lexer.RegexLexer, "__next__", lexed)
+        self.patch(incremental, "tokenize", tokenized)
+        self.patch(sparser.Parser, "parse_statements", self.timed("parse"))
+        self.patch(soulc, "loads", loaded)
+        for node in vars(ast).values():
+            if isinstance(node, type) and node.__module__ == ast.__name__:
+                if "__init__" in vars(node):
+                    self.patch(node, "__init__", self.counted("nodes built"))
+                if "eval" in vars(node):
+                    self.patch(node, "eval", self.counted("nodes evaluated"))
+        self.patch(ast.FunctionNode, "enter", self.counted("function calls"))
+        self.patch(vm.Compiler, "compile", lambda function: counting("compile_", function))
+        self.patch(vm.Compiler, "discard", lambda function: counting("discard_", function))
+        self.patch(closures.ClosureCompiler, "compile", wrapping)
+        self.patch(ModuleRegistry, "import_into", lambda function: self.counted("imports")(self.timed("import")(function)))
+        self.patch(Builder, "build", self.timed("build"))
+        self.patch(Builder, "run", self.timed("run"))
+
+    def start(self):
+        global active
+        self.install()
+        active = self
+        self.started = time.perf_counter()
+
+    def stop(self):
+        global active
+        while self.running:
+            self.exit()
+        self.total += time.perf_counter() - self.started
+        active = None
+        while self.patches:
+            (owner, name, original) = self.patches.pop()
+            setattr(owner, name, original)
+
+    def report(self):
+        return {
+            "total": self.total,
+            "phases": dict(self.seconds),
+            "counts": dict(self.counts),
+        }
+
+    def format(self):
+        lines = [f"Profile: {self.total:.6f} seconds"]
+        width = max(len(name) for name in list(self.seconds) + list(self.counts))
+        for (name, seconds) in self.seconds.items():
+            share = 100 * seconds / self.total if self.total else 0.0
+            lines.append(f"  {name:<{width}}  {seconds:.6f} s  {share:5.1f}%")
+        for (key, count) in self.counts.items():
+            lines.append(f"  {key:<{width}}  {count}")
+        return "\n".join(lines)
+
+# Records a profile of what runs inside it, then prints it or writes it to path as JSON
+@contextmanager
+def profiling(path=None):
+    profile = Profile()
+    profile.start()
+    try:
+        yield profile
+    finally:
+        profile.stop()
+        if path is None:
+            print(profile.format())
+        else:
+            with open(path, "w") as f:
+                json.dump(profile.report(), f, indent=2)
+                f.write("\n")
@@ -1,5 +1,10 @@
 from enum import Enum
 from collections import defaultdict
+from types import MappingProxyType
+from array import array
+from bisect import bisect_right
+import re
+import sys
 
 TokenKind = Enum(
     'TokenKind',
@@ -73,115 +78,171 @@ TokenKind = Enum(
     CASE
     RARROW
     CAT
+    YIELD
+    ASYNC
+    AWAIT
+    SPAWN
     '''
 )
 
+# MAPS SOURCE OFFSETS TO ROWS AND COLUMNS, BUILT THE FIRST TIME A POSITION IS ASKED FOR
+class LineIndex:
+    __slots__ = ('src', 'starts')
+
+    def __init__(self, src):
+        self.src = src
+        self.starts = None
+
+    def position(self, offset):
+        if self.starts is None:
+            self.starts = array('q', [0])
+            self.starts.extend(m.end() for m in re.finditer('\n', self.src))
+        row = bisect_right(self.starts, offset)
+        return (row, offset - self.starts[row-1] + 1)
+
+# Tokens only keep where they start, the row and column are worked out from `lines` when needed
 class Token:
-    def __init__(self, row, column, kind: TokenKind, data):
+    __slots__ = ('kind', 'data', 'offset', 'lines')
+
+    def __init__(self, kind: TokenKind, data, offset=0, lines=None):
         self.kind = kind
         self.data = data
-        self.row = row
-        self.column = column
+        self.offset = offset
+        self.lines = lines
+
+    def position(self):
+        if self.lines is None:
+            return (1, self.offset + 1)
+        return self.lines.position(self.offset)
+
+    @property
+    def row(self):
+        return self.position()[0]
+
+    @property
+    def column(self):
+        return self.position()[1]
 
     def as_tuple(self):
         return (self.row, self.column, self.kind, self.data)
 
-class Lexer:
+# Lexers report the position they have scanned up to
+class SourcePosition:
+    @property
+    def row(self):
+        return self.lines.position(self.idx)[0]
+
+    @property
+    def column(self):
+        return self.lines.position(self.idx)[1]
+
+# BUILT ONCE, SHARED READ-ONLY BY EVERY LEXER
+KEYWORDS = MappingProxyType({
+    'if': TokenKind.IF,
+    'else': TokenKind.ELSE,
+    'print': TokenKind.PRINT,
+    'var': TokenKind.VAR,
+    'is': TokenKind.EQ,
+    'not': TokenKind.NEQ,
+    'input': TokenKind.INPUT,
+    'func': TokenKind.FUNC,
+    'return': TokenKind.RETURN,
+    'soul': TokenKind.RUN,
+    'import': TokenKind.RUN,
+    'alg': TokenKind.ALGEBRA,
+    'in': TokenKind.IN,
+    'while': TokenKind.WHILE,
+    'ret': TokenKind.RET,
+    'yield': TokenKind.YIELD,
+    'async': TokenKind.ASYNC,
+    'await': TokenKind.AWAIT,
+    'spawn': TokenKind.SPAWN,
+    'break': TokenKind.BREAK,
+    'lambda': TokenKind.LAMBDA,
+    'ge': TokenKind.GE,
+    'le': TokenKind.LE,
+    'or': TokenKind.OR,
+    'and': TokenKind.AND,
+    'assert': TokenKind.ASSERT,
+    'try': TokenKind.TRY,
+    'except': TokenKind.EXCEPT,
+    'raise': TokenKind.RAISE,
+    'None': TokenKind.NONE,
+    'True': TokenKind.TRUE,
+    'False': TokenKind.FALSE,
+    'init': TokenKind.INIT,
+    'nl': TokenKind.NEWLINE,
+    'match': TokenKind.MATCH,
+    'with': TokenKind.WITH,
+    'next': TokenKind.NEXT,
+    'c': TokenKind.COMP,
+    'r': TokenKind.ROC,
+    'echo': TokenKind.ECHO,
+    'switch': TokenKind.SWITCH,
+    'case': TokenKind.CASE,
+    'category': TokenKind.CAT,
+    'cat': TokenKind.CAT,
+})
+
+OPERATORS = MappingProxyType({
+    '{': TokenKind.THEN,
+    '}': TokenKind.BLOCKEND,
+    '(': TokenKind.LPAREN,
+    ')': TokenKind.RPAREN,
+    '+': TokenKind.PLUS,
+    '-': TokenKind.MINUS,
+    '*': TokenKind.MUL,
+    '/': TokenKind.DIV,
+    '=': TokenKind.ASSIGN,
+    ';': TokenKind.ENDLN,
+    ',': TokenKind.COMMA,
+    '!': TokenKind.EXCLMK,
+    '>': TokenKind.GREAT,
+    '<': TokenKind.LESS,
+    '@': TokenKind.ALC,
+    ':': TokenKind.COLON,
+    '[': TokenKind.LBRACK,
+    ']': TokenKind.RBRACK,
+    '.': TokenKind.DOT,
+    '$': TokenKind.CMPT,
+    '==': TokenKind.EQ,
+    '!=': TokenKind.NEQ,
+    '>=': TokenKind.GE,
+    '<=': TokenKind.LE,
+    '->': TokenKind.RARROW,
+})
+
+class Lexer(SourcePosition):
     src = []
     idx = 0
-    kws = defaultdict(lambda: TokenKind.IDENT)
 
     def __init__(self, src):
         self.src = src
-        self.kws['if'] = TokenKind.IF
-        self.kws['{'] = TokenKind.THEN
-        self.kws['}'] = TokenKind.BLOCKEND
-        self.kws['('] = TokenKind.LPAREN
-        self.kws[')'] = TokenKind.RPAREN
-        self.kws['else'] = TokenKind.ELSE
-        self.kws['+'] = TokenKind.PLUS
-        self.kws['-'] = TokenKind.MINUS
-        self.kws['*'] = TokenKind.MUL
-        self.kws['/'] = TokenKind.DIV
-        self.kws['print'] = TokenKind.PRINT
-        self.kws['var'] = TokenKind.VAR
-        self.kws['='] = TokenKind.ASSIGN
-        self.kws[';'] = TokenKind.ENDLN
-        self.kws[','] = TokenKind.COMMA
-        self.kws['=='] = TokenKind.EQ
-        self.kws['is'] = TokenKind.EQ
-        self.kws['!='] = TokenKind.NEQ
-        self.kws['!'] = TokenKind.EXCLMK
-        self.kws['not'] = TokenKind.NEQ
-        self.kws['>'] = TokenKind.GREAT
-        self.kws['<'] = TokenKind.LESS
-        self.kws['input'] = TokenKind.INPUT
-        self.kws['func'] = TokenKind.FUNC
-        self.kws['return'] = TokenKind.RETURN
-        self.kws['soul'] = TokenKind.RUN
-        self.kws['import'] = TokenKind.RUN
-        self.kws['alg'] = TokenKind.ALGEBRA
-        self.kws['@'] = TokenKind.ALC
-        self.kws[':'] = TokenKind.COLON
-        self.kws['in'] = TokenKind.IN
-        self.kws['while'] = TokenKind.WHILE
-        self.kws['ret'] = TokenKind.RET
-        self.kws['break'] = TokenKind.BREAK
-        self.kws['lambda'] = TokenKind.LAMBDA
-        self.kws['ge'] = TokenKind.GE
-        self.kws['>='] = TokenKind.GE
-        self.kws['le'] = TokenKind.LE
-        self.kws['<='] = TokenKind.LE
-        self.kws['or'] = TokenKind.OR
-        self.kws['and'] = TokenKind.AND
-        self.kws['assert'] = TokenKind.ASSERT
-        self.kws['try'] = TokenKind.TRY
-        self.kws['except'] = TokenKind.EXCEPT
-        self.kws['raise'] = TokenKind.RAISE
-        self.kws['None'] = TokenKind.NONE
-        self.kws['True'] = TokenKind.TRUE
-        self.kws['False'] = TokenKind.FALSE
-        self.kws['['] = TokenKind.LBRACK
-        self.kws[']'] = TokenKind.RBRACK
-        self.kws['.'] = TokenKind.DOT
-        self.kws['init'] = TokenKind.INIT
-        self.kws['nl'] = TokenKind.NEWLINE
-        self.kws['match'] = TokenKind.MATCH
-        self.kws['with'] = TokenKind.WITH
-        self.kws['next'] = TokenKind.NEXT
-        self.kws['c'] = TokenKind.COMP
-        self.kws['r'] = TokenKind.ROC
-        self.kws['$'] = TokenKind.CMPT
-        self.kws['echo'] = TokenKind.ECHO
-        self.kws['switch'] = TokenKind.SWITCH
-        self.kws['case'] = TokenKind.CASE
-        self.kws['!'] = TokenKind.EXCLMK
-        self.kws['->'] = TokenKind.RARROW
-        self.kws['category'] = TokenKind.CAT
-        self.kws['cat'] = TokenKind.CAT
-
-        self.row = 1
-        self.column = 1
+        self.lines = LineIndex(src)
+        self.kws = defaultdict(lambda: TokenKind.IDENT, KEYWORDS)
+        self.kws.update(OPERATORS)
 
     def lex_num(self):
+        start = self.idx
         match = ""
         while self.idx < len(self.src) and self.src[self.idx].isdigit():
             match += self.src[self.idx]
             self.eat()
-        return Token(self.row, self.column, TokenKind.INT, int(match))
+        return Token(TokenKind.INT, int(match), start, self.lines)
 
     def current_char_is_valid_in_an_identifier(self):
         current = self.src[self.idx]
         return current.isidentifier()
 
     def lex_ident(self):
+        start = self.idx
         match = ""
         while self.idx < len(self.src) and self.current_char_is_valid_in_an_identifier():
             match += self.src[self.idx]
             self.eat()
 
         kind = self.kws[match]
-        return Token(self.row, self.column, kind, match)
+        return Token(kind, match, start, self.lines)
 
     def consume_whitespace(self):
         while self.idx < len(self.src) and self.src[self.idx].isspace():
@@ -207,6 +268,7 @@ class Lexer:
         elif ch == "|":
             return self.lex_comment()
         else:
+            start = self.idx
             kind = self.kws[ch]
             try:
                 nch = self.src[self.idx+1]
@@ -245,11 +307,12 @@ class Lexer:
                     kind = TokenKind.MINUS
             if kind == TokenKind.IDENT:
                 kind = TokenKind.UNKNOWN
-            return Token(self.row, self.column, kind, ch)
+            return Token(kind, ch, start, self.lines)
 
     # FOR EVALUATING STRINGS
     def lex_string_literal(self):
         assert(self.src[self.idx] == '"')
+        start = self.idx
         self.eat()
 
         literal = ""
@@ -259,13 +322,14 @@ class Lexer:
 
         if self.idx >= len(self.src):
             print("Missing end of string delimiter!")
-            return Token(self.row, self.column, TokenKind.UNKNOWN, literal)
+            return Token(TokenKind.UNKNOWN, literal, start, self.lines)
         assert(self.src[self.idx] == '"')
         self.eat()
-        return Token(self.row, self.column, TokenKind.STRING, literal)
+        return Token(TokenKind.STRING, literal, start, self.lines)
 
     def lex_single_quote_literal(self):
         assert(self.src[self.idx] == "'")
+        start = self.idx
         self.eat()
 
         literal = ""
@@ -275,13 +339,14 @@ class Lexer:
 
         if self.idx >= len(self.src):
             print("Missing end of string delimiter!")
-            return Token(self.row, self.column, TokenKind.UNKNOWN, literal)
+            return Token(TokenKind.UNKNOWN, literal, start, self.lines)
         assert(self.src[self.idx] == "'")
         self.eat()
-        return Token(self.row, self.column, TokenKind.STRING, literal)
+        return Token(TokenKind.STRING, literal, start, self.lines)
 
     def lex_comment(self):
         assert(self.src[self.idx] == '|')
+        start = self.idx
         self.eat()
 
         literal = ""
@@ -291,15 +356,129 @@ class Lexer:
 
         if self.idx >= len(self.src):
             print("Missing end of comment; |; or just | at end of file")
-            return Token(self.row, self.column, TokenKind.UNKNOWN, literal)
+            return Token(TokenKind.UNKNOWN, literal, start, self.lines)
         assert(self.src[self.idx] == '|')
         self.eat()
-        return Token(self.row, self.column, TokenKind.COMMENT, literal)
+        return Token(TokenKind.COMMENT, literal, start, self.lines)
 
     def eat(self):
-        if self.src[self.idx] == "\n" or "\r":
-            self.row += 1
-            self.column = 1
-        else:
-            self.column += 1
         self.idx += 1
+
+######################################
+# TABLE DRIVEN LEXER
+######################################
+
+# LEADING WHITESPACE, THEN ONE ALTERNATIVE PER TOKEN CLASS TRIED IN ORDER.
+# THE LAST ONE TAKES ANY CHARACTER, SO A SCAN NEVER SKIPS TEXT
+TOKEN_PATTERN = re.compile(r'''
+  \s*(?:
+    (?P<ident>[^\W\d]+)
+  | (?P<int>\d+)
+  | "(?P<string>[^"]*)"
+  | '(?P<quote>[^']*)'
+  | \|(?P<comment>[^|]*)\|
+  | (?P<open>["'|])(?P<unterminated>.*)
+  | (?P<op>==|!=|>=|<=|->|.)
+  | (?P<end>\Z)
+)''', re.VERBOSE | re.DOTALL)
+
+# YIELDS EVERY TOKEN OF THE SOURCE, OR OF src[start:end], IN ONE PASS OF TOKEN_PATTERN
+def tokenize(src, lines, start=0, end=None):
+    keywords = KEYWORDS
+    operators = OPERATORS
+    intern = sys.intern
+    Token_ = Token
+    IDENT = TokenKind.IDENT
+    UNKNOWN = TokenKind.UNKNOWN
+    for m in TOKEN_PATTERN.finditer(src, start, len(src) if end is None else end):
+        group = m.lastgroup
+        text = m.group(group)
+        if group == 'ident':
+            text = intern(text)
+            yield Token_(keywords.get(text, IDENT), text, m.start(group), lines)
+        elif group == 'op':
+            yield Token_(operators.get(text, UNKNOWN), text[0], m.start(group), lines)
+        elif group == 'int':
+            yield Token_(TokenKind.INT, int(text), m.start(group), lines)
+        elif group == 'end':
+            return
+        else:
+            # The group holds the text between the delimiters
+            start = m.start(group) - 1
+            if group == 'comment':
+                yield Token_(TokenKind.COMMENT, text, start, lines)
+            elif group == 'unterminated':
+                if m.group('open') == '|':
+                    print("Missing end of comment; |; or just | at end of file")
+                else:
+                    print("Missing end of string delimiter!")
+                yield Token_(UNKNOWN, text, start, lines)
+            else:
+                yield Token_(TokenKind.STRING, text, start, lines)
+
+# Produces the same tokens as Lexer. Positions are reported at the start of the last token read
+class RegexLexer(SourcePosition):
+    def __init__(self, src):
+        self.src = src
+        self.idx = 0
+        self.lines = LineIndex(src)
+        self.tokens = tokenize(src, self.lines)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = next(self.tokens)
+        self.idx = token.offset
+        return token
+
+# Replays tokens already read from src, for parsing a part of a source on its own
+class TokenList(SourcePosition):
+    def __init__(self, src, lines, tokens):
+        self.src = src
+        self.idx = tokens[0].offset if tokens else 0
+        self.lines = lines
+        self.tokens = iter(tokens)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        token = next(self.tokens)
+        self.idx = token.offset
+        return token
+
+KINDS = tuple([None] + list(TokenKind))
+
+# The whole token stream of a source kept in parallel buffers, a Token is only built when one is read
+class TokenBuffer(SourcePosition):
+    def __init__(self, src):
+        self.src = src
+        self.lines = LineIndex(src)
+        self.kinds = array('B')
+        self.offsets = array('q')
+        self.data = []
+        for token in tokenize(src, self.lines):
+            self.kinds.append(token.kind.value)
+            self.offsets.append(token.offset)
+            self.data.append(token.data)
+        self.pos = 0
+
+    def __len__(self):
+        return len(self.kinds)
+
+    def __getitem__(self, i):
+        return Token(KINDS[self.kinds[i]], self.data[i], self.offsets[i], self.lines)
+
+    @property
+    def idx(self):
+        return self.offsets[self.pos-1] if self.pos else 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self.pos >= len(self.kinds):
+            raise StopIteration
+        self.pos += 1
+        return self[self.pos-1]
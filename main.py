@@ -1,6 +1,6 @@
 import argparse
+import contextlib
 import os
-import subprocess as sub
 from enum import Enum
 from collections import defaultdict
 from os import error
@@ -11,6 +11,20 @@ from math import sin, cos
 from lexer import *
 from sparser import Parser
 from runtime import State
+from vm import Compiler, VM
+from closures import ClosureCompiler
+from resolver import Resolver
+import optimizer
+from optimizer import optimize
+import soulc
+from modules import registry
+from emitter import transpile
+from incremental import transpile_incremental
+from project import transpile_project
+from build import Builder, PROFILES, build_and_run
+import instrument
+import profiler
+from instrument import phase
 
 ########################################
 # DRIVER CLASSES
@@ -100,67 +114,159 @@ def dict_(key, value):
 def next_(x):
     return next(x)
 
-def read_source_file(path):
-    # Try reading the path directly
+def find_source_file(path):
+    # Try the path directly
     if os.path.isfile(path):
-        return open(path, 'r').read()
+        return path
     # Try with implied extension
     if os.path.isfile(path + '.soul'):
-        return open(path + '.soul', 'r').read()
+        return path + '.soul'
     # No such file
     raise Exception(f'No source file named {path} could be found!')
 
-def transpile_to_nim(path):
+def read_source_file(path):
+    return open(find_source_file(path), 'r').read()
+
+def parse_source_file(path, cache=True):
+    path = find_source_file(path)
+    # Its imports are looked for next to it first
+    registry.main = path
+    with phase('read'):
+        source = open(path, 'r').read()
+    if cache:
+        # Reuse the tree in the .soulc file next to the source when the source has not changed
+        return (source, soulc.load(path, source))
+    return (source, soulc.parse(source))
+
+def transpile_to_nim(path, cache=True):
     start = time.time()
-    # Read file
-    source = read_source_file(path)
-    # Parse into AST
-    ast = Parser(Lexer(source)).parse_statements()
+    path = find_source_file(path)
+    registry.main = path
     # Generate the .nim file name
     name_base = os.path.splitext(path)[0]
     output_name = name_base + '.nim'
-    # Write the generated code
-    output = open(output_name, 'w')
-    output.write(ast.compile(current_state, source, ind)) # NOTE: Why is source needed here?
+    if cache:
+        # Only the statements that changed since the last run are parsed and transpiled again
+        with phase('read'):
+            source = open(path, 'r').read()
+        with phase('transpile'), open(output_name, 'w') as output:
+            (reused, emitted) = transpile_incremental(path, source, output, current_state, LineIndex(source))
+        print(f'Compiled in: {time.time()-start} seconds ({reused} statements reused, {emitted} transpiled)')
+        return output_name
+    # Read and parse the file
+    (source, ast) = parse_source_file(path, cache)
+    # Stream the generated code into the file
+    with phase('transpile'), open(output_name, 'w') as output:
+        transpile(optimize(ast), output, current_state, LineIndex(source))
     print(f'Compiled in: {time.time()-start} seconds')
     return output_name
 
+def execute(source, engine, ast=None):
+    if ast is None:
+        ast = Parser(RegexLexer(source)).parse_statements()
+    with phase('optimize'):
+        ast = optimize(ast)
+    with phase('resolve'):
+        ast = Resolver().resolve(ast)
+    if engine == 'ast':
+        # The original tree-walking evaluator
+        with phase('eval'):
+            return ast.eval(current_state, LineIndex(source))
+    if engine == 'closure':
+        # Specialize every node into a Python closure once, then call the root
+        with phase('compile'):
+            root = ClosureCompiler(LineIndex(source)).compile(ast)
+        with phase('eval'):
+            return root(current_state)
+    # Lower the tree to bytecode and run it on the stack VM
+    with phase('compile'):
+        code = Compiler().compile_program(ast)
+    with phase('eval'):
+        return VM(LineIndex(source)).run(code, current_state)
+
+def print_opt_stats():
+    print('Optimizer: ' + ', '.join(f'{rule} {optimizer.removed[rule]}' for rule in ('fold', 'branch', 'comment', 'unreachable')) + ' nodes removed')
+
 def parse_cli_args():
     # Build the argument parser
     parser = argparse.ArgumentParser()
     parser.add_argument('-c', help='Transpile to Nim', action='store_true')
     parser.add_argument('-r', help='Immediately run transpiled Nim', action='store_true')
-    parser.add_argument('sourcefile', help='The source file to transpile or run', nargs='?')
+    parser.add_argument('--engine', help='The evaluator used to run the source', choices=['vm', 'closure', 'ast'], default='vm')
+    parser.add_argument('--no-cache', help='Always parse the source instead of using its .soulc file', action='store_true')
+    parser.add_argument('--opt-stats', help='Report how many nodes each optimizer rule removed', action='store_true')
+    parser.add_argument('--import-stats', help='Report how many module parses the import registry avoided', action='store_true')
+    parser.add_argument('--nim', help='The Nim compiler command used by -r, $SOUL_NIM or nim by default')
+    parser.add_argument('--build', help='The optimization profile -r builds with', choices=list(PROFILES), default='debug')
+    parser.add_argument('--cache-dir', help='Where -r keeps builds between runs, $SOUL_CACHE or ~/.cache/soul by default')
+    parser.add_argument('--profile', help='Report the time each phase took, with the tokens lexed, nodes built and evaluated, calls and imports', action='store_true')
+    parser.add_argument('--profile-json', help='Write the --profile report to this file as JSON', metavar='PATH')
+    parser.add_argument('--profile-calls', help='Report the calls, self and cumulative time of every Soul function', action='store_true')
+    parser.add_argument('--flamegraph', help='Write the call stacks of Soul functions to this file as collapsed stacks', metavar='PATH')
+    parser.add_argument('-j', '--jobs', help='Worker processes when transpiling several modules, all cores by default', type=int)
+    parser.add_argument('sourcefiles', help='The source file to run, or the files and directories to transpile', nargs='*')
     # Do the parse
-    return parser.parse_args()
+    args = parser.parse_args()
+    args.sourcefile = args.sourcefiles[0] if args.sourcefiles else None
+    return args
 
 def assert_source_file_in_cli_args(args):
     if args.sourcefile == None:
         raise Exception(f'No source file provided in the command line arguments!')
 
+def profiling(args):
+    # Nothing is timed or counted without --profile or --profile-calls
+    stack = contextlib.ExitStack()
+    if args.profile or args.profile_json:
+        stack.enter_context(instrument.profiling(args.profile_json))
+    if args.profile_calls or args.flamegraph:
+        stack.enter_context(profiler.profiling(args.profile_calls, args.flamegraph))
+    return stack
+
 def main():
     args = parse_cli_args()
     print(args.sourcefile)
+    if args.r or args.c or args.sourcefile != None:
+        with profiling(args):
+            run(args)
+    else:
+        # REPL, every line gets its own profile
+        while True:
+            source = input('>>> ')
+            with profiling(args):
+                print(execute(source, args.engine))
+
+def run(args):
     if args.r:
         # We want to run with the Nim compiler
         assert_source_file_in_cli_args(args)
-        output = transpile_to_nim(args.sourcefile)
-        sub.Popen(['cmd', '/K', f'nim c -r {output}'])
+        output = transpile_to_nim(args.sourcefile, not args.no_cache)
+        # The build is skipped when the transpiled Nim did not change since the last one
+        sys.exit(build_and_run(output, Builder(args.nim, args.build, args.cache_dir)))
+    elif args.c and (len(args.sourcefiles) > 1 or os.path.isdir(args.sourcefiles[0] if args.sourcefiles else '')):
+        # We want to transpile a whole project to Nim, modules that do not import each other in parallel
+        paths = [path if os.path.isdir(path) else find_source_file(path) for path in args.sourcefiles]
+        # Only the time shows in a profile, what the workers count stays in their processes
+        with phase('transpile'):
+            status = transpile_project(paths, args.jobs, not args.no_cache)
+        sys.exit(status)
     elif args.c:
         # We want to transpile to Nim
         assert_source_file_in_cli_args(args)
-        transpile_to_nim(args.sourcefile)
+        transpile_to_nim(args.sourcefile, not args.no_cache)
+        if args.opt_stats:
+            print_opt_stats()
     elif args.sourcefile != None:
         # There is a source file to execute
-        source = read_source_file(args.sourcefile)
         start = time.time()
-        print(Parser(Lexer(source)).parse_statements().eval(current_state, Lexer(source))) # NOTE: Why is a Lexer needed twice?
+        (source, ast) = parse_source_file(args.sourcefile, not args.no_cache)
+        print(execute(source, args.engine, ast))
         print(f'Executed in: {time.time()-start} seconds')
-    else:
-        # REPL
-        while True:
-            source = input('>>> ')
-            print(Parser(Lexer(source)).parse_statements().eval(current_state, Lexer(source))) # NOTE: Why is a Lexer needed twice?
+        if args.opt_stats:
+            print_opt_stats()
+        if args.import_stats:
+            stats = registry.stats()
+            print(f"Imports: {stats['modules']} modules, {stats['parses']} parses, {stats['parses avoided']} parses avoided")
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,85 @@
+import os
+import soulc
+from lexer import LineIndex
+from runtime import State, CircularImportError
+from resolver import Resolver
+from optimizer import optimize
+
+######################################
+# MODULE REGISTRY FOR import/soul
+######################################
+
+# A module runs once, in its own namespace. Every import of it after that binds the names it
+# defined into the importing scope and returns the value it evaluated to, without parsing it again.
+
+# The file `import name` runs: name.soul next to the file importing it when there is one, else under the working
+# directory. The project transpiler builds its import graph with the same rule
+def locate(name, importer=None):
+    if importer is not None:
+        path = os.path.join(os.path.dirname(os.path.abspath(importer)), str(name)+'.soul')
+        if os.path.exists(path):
+            return path
+    return os.path.abspath(str(name)+'.soul')
+
+class Module:
+    def __init__(self, path, stamp, digest, namespace, value):
+        self.path = path
+        # (mtime, size) of the file when it was last checked
+        self.stamp = stamp
+        self.digest = digest
+        self.namespace = namespace
+        self.value = value
+
+class ModuleRegistry:
+    def __init__(self):
+        self.modules = {}
+        # Paths of the modules being run right now, in import order
+        self.loading = []
+        self.parses = 0
+        self.parses_avoided = 0
+        # The file of the program being run or transpiled, whose imports are looked for next to it
+        self.main = None
+
+    # run(tree, state, lines) evaluates a resolved module tree with the importer's engine, lines being the LineIndex of
+    # the module's source its errors are reported against
+    def load(self, name, run):
+        path = locate(name, self.loading[-1] if self.loading else self.main)
+        stat = os.stat(path)
+        stamp = (stat.st_mtime_ns, stat.st_size)
+        module = self.modules.get(path)
+        if module is not None and module.stamp == stamp:
+            self.parses_avoided += 1
+            return module
+        if path in self.loading:
+            chain = self.loading[self.loading.index(path):] + [path]
+            raise CircularImportError("CircularImportError: "+" -> ".join(os.path.basename(p) for p in chain))
+        with open(path, 'r') as f:
+            source = f.read()
+        digest = soulc.digest(source)
+        if module is not None and module.digest == digest:
+            # Touched but not changed
+            module.stamp = stamp
+            self.parses_avoided += 1
+            return module
+        self.loading.append(path)
+        try:
+            self.parses += 1
+            tree = Resolver().resolve(optimize(soulc.load(path, source)))
+            namespace = State()
+            value = run(tree, namespace, LineIndex(source))
+        finally:
+            self.loading.pop()
+        module = Module(path, stamp, digest, namespace, value)
+        self.modules[path] = module
+        return module
+
+    def import_into(self, name, state, run):
+        module = self.load(name, run)
+        for (key, value) in module.namespace.vals.items():
+            state.bind(key, value)
+        return module.value
+
+    def stats(self):
+        return {'modules': len(self.modules), 'parses': self.parses, 'parses avoided': self.parses_avoided}
+
+registry = ModuleRegistry()
@@ -0,0 +1,165 @@
+import operator
+from array import array
+from itertools import repeat
+from runtime import builtin
+
+######################################
+# TYPED NUMERIC ARRAYS (int -> [...])
+######################################
+
+# `int -> [...]` and `float -> [...]` make a NumArray, which keeps its elements as machine ints or doubles in one
+# array.array. The arithmetic operators and comparisons apply to every element at once: map() drives the operator
+# over both buffers in C, where a Soul loop would go through a list one element at a time. The other operand is an
+# array or list of the same length, or a number used for every element. Comparisons give an int array of 1s and 0s.
+# sum, min, max, any and all take arrays as they are, dot(a, b) sums the products of two arrays. An array has the
+# methods of a list too, so code written for a list keeps working on one.
+
+TYPECODES = {int: "q", float: "d"}
+
+# The element types each kind of array takes, floats take ints too
+ACCEPTS = {int: {int}, float: {int, float}}
+
+def kind_of(values):
+    return float if float in set(map(type, values)) else int
+
+class NumArray:
+    __slots__ = ("kind", "data")
+    # Arrays change, and == gives an array
+    __hash__ = None
+
+    def __init__(self, kind, data):
+        self.kind = kind
+        self.data = data
+
+    @staticmethod
+    def of(kind, values):
+        if not set(map(type, values)) <= ACCEPTS[kind]:
+            raise TypeError("Type of list elements did not match specification")
+        return NumArray(kind, array(TYPECODES[kind], values))
+
+    def __repr__(self):
+        return repr(self.data.tolist())
+
+    def __len__(self):
+        return len(self.data)
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __contains__(self, value):
+        return value in self.data
+
+    def __getitem__(self, index):
+        if type(index) is slice:
+            return NumArray(self.kind, self.data[index])
+        return self.data[index]
+
+    def __setitem__(self, index, value):
+        self.data[index] = value
+
+    def __bool__(self):
+        if len(self.data) != 1:
+            raise TypeError(f"The truth of an array of {len(self.data)} elements is ambiguous, use any() or all()")
+        return bool(self.data[0])
+
+    # The methods of a list, for code written for one. extend() checks the elements the way of() does, for single
+    # elements the buffer refuses a float in an int array itself
+
+    def append(self, value):
+        self.data.append(value)
+
+    def extend(self, values):
+        values = values.data if type(values) is NumArray else list(values)
+        if not set(map(type, values)) <= ACCEPTS[self.kind]:
+            raise TypeError("Type of list elements did not match specification")
+        self.data.extend(values)
+
+    def insert(self, index, value):
+        self.data.insert(index, value)
+
+    def pop(self, index=-1):
+        return self.data.pop(index)
+
+    def remove(self, value):
+        self.data.remove(value)
+
+    def clear(self):
+        del self.data[:]
+
+    def index(self, value, *bounds):
+        return self.data.index(value, *bounds)
+
+    def count(self, value):
+        return self.data.count(value)
+
+    def reverse(self):
+        self.data.reverse()
+
+    def sort(self, key=None, reverse=False):
+        self.data = array(self.data.typecode, sorted(self.data, key=key, reverse=reverse))
+
+    def copy(self):
+        return NumArray(self.kind, array(self.data.typecode, self.data))
+
+    def tolist(self):
+        return self.data.tolist()
+
+    # The elements of the other operand, as many as this array has, and their kind. (None, None) when it is no number
+    def operand(self, other):
+        t = type(other)
+        if t is NumArray:
+            data = other.data
+            kind = other.kind
+        elif t is list or t is tuple:
+            if not set(map(type, other)) <= ACCEPTS[float]:
+                return (None, None)
+            data = other
+            kind = kind_of(other)
+        elif t is int or t is float or t is bool:
+            return (repeat(other, len(self.data)), float if t is float else int)
+        else:
+            return (None, None)
+        if len(data) != len(self.data):
+            raise ValueError(f"Arrays of different lengths: {len(self.data)} and {len(data)}")
+        return (data, kind)
+
+def elementwise(function, kind=None, reflected=False):
+    # kind is what the operator always gives, by default float when either side is float
+    def apply(self, other):
+        (data, other_kind) = self.operand(other)
+        if data is None:
+            return NotImplemented
+        result = kind or (float if self.kind is float or other_kind is float else int)
+        if reflected:
+            return NumArray(result, array(TYPECODES[result], map(function, data, self.data)))
+        return NumArray(result, array(TYPECODES[result], map(function, self.data, data)))
+    return apply
+
+for (name, function, kind) in (
+    ("add", operator.add, None), ("sub", operator.sub, None), ("mul", operator.mul, None),
+    ("truediv", operator.truediv, float),
+):
+    setattr(NumArray, f"__{name}__", elementwise(function, kind))
+    setattr(NumArray, f"__r{name}__", elementwise(function, kind, True))
+
+for (name, function) in (("eq", operator.eq), ("ne", operator.ne), ("lt", operator.lt), ("le", operator.le), ("gt", operator.gt), ("ge", operator.ge)):
+    setattr(NumArray, f"__{name}__", elementwise(function, int))
+
+@builtin
+def numeric(values):
+    # The list (or range) values as an array, of ints when they all are
+    values = list(values)
+    return NumArray.of(kind_of(values), values)
+
+@builtin
+def fill(length, value):
+    return NumArray(kind_of([value]), array(TYPECODES[kind_of([value])], [value]) * length)
+
+@builtin
+def dot(a, b):
+    if type(a) is not NumArray:
+        a = numeric(a)
+    (data, kind) = a.operand(b)
+    if data is None:
+        raise TypeError(f"dot needs two arrays, not {type(b).__name__}")
+    return sum(map(operator.mul, a.data, data))
@@ -0,0 +1,147 @@
+import operator
+from collections import Counter
+from ast import *
+from lexer import TokenKind
+from resolver import children
+
+######################################
+# TREE OPTIMIZATIONS BEFORE RESOLVING AND RUNNING
+######################################
+
+# Every rule counts the nodes it took out of the tree, under its name:
+#   fold         BinOps whose operands are all literals, replaced by the literal they evaluate to
+#   branch       IfExprs with a literal condition, replaced by the branch that runs
+#   comment      Comments in the middle of a statement sequence
+#   unreachable  statements after a return or break in the same sequence
+
+FOLDS = {
+    TokenKind.PLUS: operator.add,
+    TokenKind.MINUS: operator.sub,
+    TokenKind.MUL: operator.mul,
+    TokenKind.DIV: operator.truediv,
+    TokenKind.EQ: operator.eq,
+    TokenKind.NEQ: operator.ne,
+    TokenKind.GREAT: operator.gt,
+    TokenKind.LESS: operator.lt,
+    TokenKind.GE: operator.ge,
+    TokenKind.LE: operator.le,
+    TokenKind.IN: lambda a, b: a in b,
+    TokenKind.AND: lambda a, b: a and b,
+    TokenKind.OR: lambda a, b: a or b,
+}
+
+LITERALS = {
+    "NumExpr": lambda node: node.val,
+    "String": lambda node: node.string,
+    "TrueNode": lambda node: True,
+    "FalseNode": lambda node: False,
+}
+
+# Folding "ab" * 100000 would only move a big allocation from runtime into every load
+MAX_FOLDED_STRING = 1024
+
+def literal(value):
+    if value is True:
+        return TrueNode()
+    if value is False:
+        return FalseNode()
+    if type(value) in (int, float):
+        return NumExpr(value)
+    if type(value) == str and len(value) <= MAX_FOLDED_STRING:
+        return String(value)
+    return None
+
+def size(node):
+    return 1 + sum(size(child) for child in children(node))
+
+def statements(node):
+    flat = []
+    while type(node) == SequenceNode:
+        flat.append(node.second)
+        node = node.first
+    flat.append(node)
+    flat.reverse()
+    return flat
+
+def sequence(flat):
+    node = flat[0]
+    for statement in flat[1:]:
+        node = SequenceNode(node, statement)
+    return node
+
+class Optimizer:
+    def __init__(self):
+        self.removed = Counter()
+
+    def optimize(self, node):
+        return self.visit(node)
+
+    def visit(self, node):
+        return getattr(self, "visit_"+type(node).__name__, self.visit_children)(node)
+
+    def visit_children(self, node):
+        for (name, value) in vars(node).items():
+            if isinstance(value, AST):
+                setattr(node, name, self.visit(value))
+            elif type(value) == list:
+                value[:] = [self.visit(item) if isinstance(item, AST) else item for item in value]
+            elif type(value) == dict:
+                items = [(self.visit(key) if isinstance(key, AST) else key, self.visit(item) if isinstance(item, AST) else item) for (key, item) in value.items()]
+                value.clear()
+                value.update(items)
+        return node
+
+    def visit_SequenceNode(self, node):
+        flat = statements(node)
+        kept = []
+        for (i, statement) in enumerate(flat):
+            if type(statement) == Comment and i != len(flat) - 1:
+                # A trailing comment stays, it is what the sequence evaluates to
+                self.removed["comment"] += 1
+                continue
+            kept.append(self.visit(statement) if isinstance(statement, AST) else statement)
+            if type(statement) in (ReturnNode, BreakNode):
+                self.removed["unreachable"] += sum(size(s) if isinstance(s, AST) else 1 for s in flat[i+1:])
+                break
+        return sequence(kept)
+
+    def visit_BinOp(self, node):
+        self.visit_children(node)
+        first = LITERALS.get(type(node.first).__name__)
+        second = LITERALS.get(type(node.second).__name__)
+        if first is None or second is None or node.op not in FOLDS:
+            return node
+        try:
+            folded = literal(FOLDS[node.op](first(node.first), second(node.second)))
+        except Exception:
+            # Leave errors like 1 / 0 to happen at runtime, where they can be caught
+            return node
+        if folded is None:
+            return node
+        self.removed["fold"] += 2
+        return folded
+
+    def visit_IfExpr(self, node):
+        self.visit_children(node)
+        cond = LITERALS.get(type(node.cond).__name__)
+        if node.cmpt is not None or cond is None:
+            return node
+        if cond(node.cond):
+            (taken, dropped) = (node.left, node.right)
+        else:
+            (taken, dropped) = (node.right, node.left)
+        self.removed["branch"] += 1 + size(node.cond) + (size(dropped) if isinstance(dropped, AST) else 0)
+        if taken is None:
+            # An if without an else that never runs still evaluates to None
+            self.removed["branch"] -= 1
+            return NoneNode()
+        return taken
+
+# Totals over every tree optimized in this process, for --opt-stats
+removed = Counter()
+
+def optimize(tree):
+    optimizer = Optimizer()
+    tree = optimizer.optimize(tree)
+    removed.update(optimizer.removed)
+    return tree
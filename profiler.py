@@ -0,0 +1,116 @@
+import threading
+import time
+from contextlib import contextmanager
+
+######################################
+# SOUL CALL PROFILER (--profile-calls)
+######################################
+
+# While a profiler is active every Soul function the engines make is wrapped, so its calls are timed per name and
+# tracked on a call stack of Soul functions. A call's self time is its time minus that of the calls it made.
+# The stacks are kept as a tree of the paths calls were made along, which --flamegraph writes out as collapsed
+# stacks. Functions made before the profiler started, or after it stopped, are never wrapped.
+
+# The profiler recording calls, None when there is none
+active = None
+
+# function unless a profiler is active, then function with its calls recorded under name
+def wrap(name, function):
+    if active is None:
+        return function
+    return active.wrap(name, function)
+
+class CallProfiler:
+    def __init__(self):
+        # Name -> [calls, self seconds, cumulative seconds]
+        self.functions = {}
+        # The call tree, a node is [self seconds, {name: node}]
+        self.root = [0.0, {}]
+        # [name, start, seconds of the calls made from it, node] of the calls running, outermost first, one list
+        # per thread, so the calls of a spawned task start a path of their own
+        self.threads = threading.local()
+        self.running = self.stack()
+        # Name -> calls of it running, a recursive function's cumulative time is only its outermost call's
+        self.depth = {}
+
+    def stack(self):
+        running = getattr(self.threads, "running", None)
+        if running is None:
+            running = self.threads.running = []
+        return running
+
+    def wrap(self, name, function):
+        def profiled(*args):
+            self.enter(name)
+            try:
+                return function(*args)
+            finally:
+                self.exit()
+        return profiled
+
+    def enter(self, name):
+        running = self.stack()
+        parent = running[-1][3] if running else self.root
+        node = parent[1].get(name)
+        if node is None:
+            node = parent[1][name] = [0.0, {}]
+        self.depth[name] = self.depth.get(name, 0) + 1
+        running.append([name, time.perf_counter(), 0.0, node])
+
+    def exit(self):
+        running = self.stack()
+        (name, start, inner, node) = running.pop()
+        elapsed = time.perf_counter() - start
+        stats = self.functions.get(name)
+        if stats is None:
+            stats = self.functions[name] = [0, 0.0, 0.0]
+        stats[0] += 1
+        stats[1] += elapsed - inner
+        node[0] += elapsed - inner
+        self.depth[name] -= 1
+        if not self.depth[name]:
+            stats[2] += elapsed
+        if running:
+            running[-1][2] += elapsed
+
+    def stop(self):
+        while self.running:
+            self.exit()
+
+    # The functions by self time, most first
+    def table(self):
+        rows = sorted(self.functions.items(), key=lambda item: (-item[1][1], item[0]))
+        width = max([len(name) for name in self.functions] + [len("function")])
+        lines = [f"{'function':<{width}}  {'calls':>10}  {'self s':>10}  {'cumulative s':>12}  {'self/call ms':>12}"]
+        for (name, (calls, own, cumulative)) in rows:
+            lines.append(f"{name:<{width}}  {calls:>10}  {own:>10.6f}  {cumulative:>12.6f}  {1000 * own / calls:>12.6f}")
+        return "\n".join(lines)
+
+    # One `outer;...;inner microseconds` line per call path, for flamegraph.pl and the like
+    def collapsed(self):
+        lines = []
+        stack = [(name, node) for (name, node) in sorted(self.root[1].items(), reverse=True)]
+        while stack:
+            (path, node) = stack.pop()
+            weight = round(node[0] * 1e6)
+            if weight > 0:
+                lines.append(f"{path} {weight}")
+            stack.extend((path+";"+name, child) for (name, child) in sorted(node[1].items(), reverse=True))
+        return "\n".join(lines)
+
+# Records the calls of what runs inside it, then prints the table and writes the collapsed stacks to path
+@contextmanager
+def profiling(table=True, path=None):
+    global active
+    profiler = active = CallProfiler()
+    try:
+        yield profiler
+    finally:
+        active = None
+        profiler.stop()
+        if table:
+            print(profiler.table())
+        if path is not None:
+            with open(path, "w") as f:
+                text = profiler.collapsed()
+                f.write(text + "\n" if text else "")
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from ast import *
+import soulc
+from lexer import LineIndex
+from runtime import State
+from resolver import children
+from optimizer import optimize
+from emitter import transpile
+from incremental import transpile_incremental
+from modules import registry, locate
+
+######################################
+# TRANSPILING MANY MODULES AT ONCE
+######################################
+
+# Every module is parsed once in a worker to find what it imports, then transpiled in a worker as soon as
+# the modules it imports are done. Modules that do not depend on each other run side by side.
+
+def source_files(paths):
+    # Directories stand for every .soul file under them
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for (root, dirs, names) in os.walk(path):
+                dirs.sort()
+                files.extend(os.path.join(root, name) for name in names if name.endswith('.soul'))
+        else:
+            files.append(path)
+    return sorted(set(os.path.abspath(path) for path in files))
+
+def start_worker():
+    # Imports run at compile time on the tree walker, which recurses once per statement of a sequence.
+    # A worker that has not loaded a module yet runs the whole chain of its imports
+    sys.setrecursionlimit(100000)
+
+def parse_module(path, cache=True):
+    with open(path, 'r') as f:
+        source = f.read()
+    return (source, soulc.load(path, source) if cache else soulc.parse(source))
+
+# The names given to import/soul in a tree, in no particular order
+def imported(tree):
+    names = []
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if type(node) == Run:
+            names.append(str(node.file))
+        stack.extend(children(node))
+    return names
+
+def scan_module(path, cache=True):
+    return imported(parse_module(path, cache)[1])
+
+def transpile_module(path, cache=True):
+    output_name = os.path.splitext(path)[0] + '.nim'
+    # Its imports run while it is transpiled, and have to find the files the import graph found
+    registry.main = path
+    if cache:
+        with open(path, 'r') as f:
+            source = f.read()
+        with open(output_name, 'w') as output:
+            transpile_incremental(path, source, output, State(), LineIndex(source))
+        return output_name
+    (source, tree) = parse_module(path, cache)
+    with open(output_name, 'w') as output:
+        transpile(optimize(tree), output, State(), LineIndex(source))
+    return output_name
+
+# The module an import runs, found as the module registry finds it. Imports of files that are not part of the
+# build are left to the transpiler
+def resolve_import(name, importer, modules):
+    path = locate(name, importer)
+    return path if path in modules else None
+
+def import_graph(scans, modules):
+    graph = {}
+    for (path, names) in scans.items():
+        deps = (resolve_import(name, path, modules) for name in names)
+        graph[path] = sorted(set(dep for dep in deps if dep is not None and dep != path))
+    return graph
+
+def error_message(error):
+    message = str(error)
+    # Soul's own errors already start with their kind
+    if message.startswith(type(error).__name__):
+        return message
+    return f'{type(error).__name__}: {message}'
+
+class Project:
+    def __init__(self, paths, jobs=None, cache=True):
+        self.paths = source_files(paths)
+        self.jobs = jobs
+        self.cache = cache
+        # path -> (output name, None) or (None, error message)
+        self.results = {}
+
+    def run(self):
+        with ProcessPoolExecutor(self.jobs, initializer=start_worker) as pool:
+            scans = {}
+            futures = {path: pool.submit(scan_module, path, self.cache) for path in self.paths}
+            for (path, future) in futures.items():
+                try:
+                    scans[path] = future.result()
+                except Exception as error:
+                    self.results[path] = (None, error_message(error))
+            graph = import_graph(scans, set(self.paths))
+            self.schedule(pool, graph)
+        return self.results
+
+    def schedule(self, pool, graph):
+        waiting = {path: set(deps) for (path, deps) in graph.items()}
+        dependents = defaultdict(list)
+        for (path, deps) in graph.items():
+            for dep in deps:
+                dependents[dep].append(path)
+        running = {}
+        def finish(path, result):
+            # A module is only transpiled after everything it imports was, a failure skips what imports it
+            done = [(path, result)]
+            while done:
+                (path, result) = done.pop()
+                self.results[path] = result
+                for dependent in dependents[path]:
+                    if dependent not in waiting:
+                        continue
+                    if result[0] is None:
+                        del waiting[dependent]
+                        done.append((dependent, (None, f'Skipped, {os.path.basename(path)} failed')))
+                    else:
+                        waiting[dependent].discard(path)
+        for (path, deps) in graph.items():
+            # Modules that failed to parse can not be imported either
+            failed = [dep for dep in deps if dep in self.results]
+            if failed and path in waiting:
+                del waiting[path]
+                finish(path, (None, f'Skipped, {os.path.basename(failed[0])} failed'))
+        while waiting or running:
+            for path in sorted(path for (path, deps) in waiting.items() if not deps):
+                del waiting[path]
+                running[pool.submit(transpile_module, path, self.cache)] = path
+            if not running:
+                # Everything left is part of an import cycle or imports one
+                for path in sorted(waiting):
+                    self.results[path] = (None, 'CircularImportError: waits on ' + ', '.join(os.path.basename(p) for p in sorted(waiting[path])))
+                return
+            (done, _) = wait(running, return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=running.get):
+                path = running.pop(future)
+                try:
+                    finish(path, (future.result(), None))
+                except Exception as error:
+                    finish(path, (None, error_message(error)))
+
+def transpile_project(paths, jobs=None, cache=True):
+    start = time.time()
+    results = Project(paths, jobs, cache).run()
+    failed = 0
+    for path in sorted(results):
+        (output, error) = results[path]
+        if error is None:
+            print(f'{os.path.relpath(path)} -> {os.path.relpath(output)}')
+        else:
+            failed += 1
+            print(f'{os.path.relpath(path)}: {error}')
+    print(f'Compiled {len(results) - failed} of {len(results)} modules in: {time.time()-start} seconds')
+    return 1 if failed else 0
@@ -0,0 +1,170 @@
+from ast import *
+
+######################################
+# STATIC RESOLUTION OF NAMES TO FRAME SLOTS
+######################################
+
+# After resolving:
+#   VarExpr.slot  is (depth, slot) for a name declared in an enclosing function, (depth, None) for a name
+#                 that lives `depth` frames out (globals, builtins), or None to look it up dynamically
+#   Assign.slot   is (0, slot) when the target is a slot of the current frame, else None
+#   FunctionNode.frame is the name -> slot layout of its call frames, or None for a dictionary frame
+# The module level always stays a dictionary, since imports, delete() and get_state() work on it by name.
+
+class FunctionScope:
+    def __init__(self, params, dynamic=False):
+        self.index = {"self": 0}
+        self.dynamic = dynamic
+        for param in params:
+            self.declare(param)
+    def declare(self, name):
+        if name not in self.index:
+            self.index[name] = len(self.index)
+
+def children(node):
+    for value in vars(node).values():
+        if isinstance(value, AST):
+            yield value
+        elif type(value) == list:
+            for item in value:
+                if isinstance(item, AST):
+                    yield item
+        elif type(value) == dict:
+            for (key, item) in value.items():
+                if isinstance(key, AST):
+                    yield key
+                if isinstance(item, AST):
+                    yield item
+
+# MARK THE CALLS WHOSE VALUE THE FUNCTION RETURNS AS IS. `tail` SAYS WHETHER node'S OWN VALUE IS RETURNED
+def mark_tail_calls(node, tail):
+    t = type(node).__name__
+    if t == "FunctionNode" or t == "Categories" or t == "TryExceptNode":
+        # Other functions mark their own, and a try has to stay on the stack to catch what the call raises
+        return False
+    if t == "WhileExpr" and node.ret == "yield":
+        # A return in a stream only ends it, the call is made and its value dropped
+        return False
+    if t == "Call" and tail and node.cmpt == None:
+        node.tail = True
+        return True
+    if t == "ReturnNode":
+        return mark_tail_calls(node.value, True)
+    marked = False
+    if t == "SequenceNode":
+        while type(node).__name__ == "SequenceNode":
+            marked = mark_tail_calls(node.second, tail) or marked
+            node = node.first
+            tail = False
+        return mark_tail_calls(node, False) or marked
+    if t == "IfExpr":
+        marked = mark_tail_calls(node.cond, False)
+        marked = mark_tail_calls(node.left, tail) or marked
+        if node.right != None:
+            marked = mark_tail_calls(node.right, tail) or marked
+        return marked
+    for child in children(node):
+        marked = mark_tail_calls(child, False) or marked
+    return marked
+
+# MARK THE RETURNS AND BREAKS THE TREE WALKER SIGNALS WITH A Completion INSTEAD OF AN EXCEPTION. `returns` AND `breaks`
+# SAY WHETHER A COMPLETION EVALUATED AT node WOULD BE HANDED UP, UNTOUCHED, TO THE ENCLOSING FUNCTION OR LOOP
+def mark_completions(node, returns, breaks):
+    t = type(node).__name__
+    if t == "FunctionNode" or t == "Categories":
+        # Functions mark their own bodies
+        return
+    if t == "ReturnNode" or t == "BreakNode":
+        node.signal = returns if t == "ReturnNode" else breaks
+        mark_completions(node.value, False, False)
+        return
+    if t == "SequenceNode":
+        while type(node).__name__ == "SequenceNode":
+            mark_completions(node.second, returns, breaks)
+            node = node.first
+        mark_completions(node, returns, breaks)
+        return
+    if t == "WhileExpr" and node.ret == "yield":
+        # A stream outlives the function that made it, a return or break that reaches it ends the stream
+        mark_completions(node.cond, False, False)
+        mark_completions(node.left, True, True)
+        return
+    if t == "IfExpr" or t == "TryExceptNode" or t == "WhileExpr":
+        for child in children(node):
+            if child is node.left or child is getattr(node, "right", None):
+                mark_completions(child, returns, breaks or t == "WhileExpr")
+            else:
+                mark_completions(child, False, False)
+        return
+    for child in children(node):
+        mark_completions(child, False, False)
+
+class Resolver:
+    def __init__(self):
+        self.scopes = []
+
+    def resolve(self, node):
+        self.visit(node)
+        mark_completions(node, False, False)
+        return node
+
+    def visit(self, node):
+        getattr(self, "visit_"+type(node).__name__, self.visit_children)(node)
+
+    def visit_children(self, node):
+        for child in children(node):
+            self.visit(child)
+
+    def address(self, name):
+        depth = 0
+        for scope in reversed(self.scopes):
+            if scope.dynamic:
+                return None
+            if name in scope.index:
+                return (depth, scope.index[name])
+            depth += 1
+        return (depth, None) if depth else None
+
+    def visit_VarExpr(self, node):
+        node.slot = self.address(node.name)
+
+    def visit_Assign(self, node):
+        self.visit(node.assignment)
+        if self.scopes and not self.scopes[-1].dynamic:
+            node.slot = (0, self.scopes[-1].index[node.var])
+        else:
+            node.slot = None
+
+    def visit_FunctionNode(self, node):
+        if isinstance(node.return_type, AST):
+            self.visit(node.return_type)
+        scope = FunctionScope(node.params)
+        self.declare(node.body, scope)
+        node.frame = None if scope.dynamic else scope.index
+        self.scopes.append(scope)
+        self.visit(node.body)
+        self.scopes.pop()
+        mark_completions(node.body, True, False)
+        if node.return_type == "any":
+            # A typed function checks what it returns, so it has to wait for its calls
+            node.tail_calls = mark_tail_calls(node.body, True)
+
+    def visit_Categories(self, node):
+        self.visit(node.objects)
+        self.scopes.append(FunctionScope([], dynamic=True))
+        self.visit(node.body)
+        self.scopes.pop()
+
+    # COLLECT EVERY NAME A FUNCTION BODY BINDS, WITHOUT ENTERING NESTED FUNCTIONS
+    def declare(self, node, scope):
+        t = type(node).__name__
+        if t == "Assign" or t == "AlgerbraicVariable":
+            scope.declare(node.var)
+        elif t == "FunctionNode" or t == "Categories":
+            scope.declare(node.name)
+            return
+        elif t == "Run":
+            # An import binds whatever the module defines, so the frame has to stay a dictionary
+            scope.dynamic = True
+        for child in children(node):
+            self.declare(child, scope)
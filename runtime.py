@@ -1,17 +1,93 @@
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+# Marks a name missing from a frame
+UNBOUND = object()
+
+# Python functions Soul programs can call by name, found after every frame and before Python's own names
+BUILTINS = {}
+
+def builtin(fn):
+    BUILTINS[fn.__name__] = fn
+    return fn
 
 class State:
     # vals = {}
-    def __init__(self):
+    # Lookups walk out through the parents, binds always stay local
+    # Frames laid out by the resolver also keep their names in `slots`, at the position `index` gives
+    index = {}
+    slots = None
+    def __init__(self, parent=None, index=None):
         self.vals = dict()
+        self.parent = parent
+        if index is not None:
+            self.index = index
+            self.slots = [UNBOUND] * len(index)
     def bind(self, name, val):
-        self.vals[name] = val
+        if name in self.index:
+            self.slots[self.index[name]] = val
+        else:
+            self.vals[name] = val
+    def find(self, name):
+        state = self
+        while state is not None:
+            if name in state.index:
+                val = state.slots[state.index[name]]
+                if val is not UNBOUND:
+                    return val
+            vals = state.vals
+            if name in vals:
+                return vals[name]
+            state = state.parent
+        return UNBOUND
     def lookup(self, name):
-        try:
-            return self.vals[name]
-        except:
-            return eval(name)
+        val = self.find(name)
+        if val is UNBOUND:
+            val = BUILTINS.get(name, UNBOUND)
+            if val is UNBOUND:
+                return eval(name)
+        return val
     def unbind(self, name):
+        if name in self.index and self.slots[self.index[name]] is not UNBOUND:
+            val = self.slots[self.index[name]]
+            self.slots[self.index[name]] = UNBOUND
+            return val
         return self.vals.pop(name)
+    def names(self):
+        seen = {}
+        state = self
+        while state is not None:
+            for (name, slot) in state.index.items():
+                if state.slots[slot] is not UNBOUND:
+                    seen.setdefault(name, None)
+            for name in state.vals:
+                seen.setdefault(name, None)
+            state = state.parent
+        return list(seen)
+
+# What `self` is bound to inside a call: every visible name, writes go to the call's own frame
+class Scope(MutableMapping):
+    __slots__ = ('state',)
+    def __init__(self, state):
+        self.state = state
+    def __getitem__(self, name):
+        val = self.state.find(name)
+        if val is UNBOUND:
+            raise KeyError(name)
+        return val
+    def __setitem__(self, name, val):
+        self.state.bind(name, val)
+    def __delitem__(self, name):
+        try:
+            self.state.unbind(name)
+        except KeyError:
+            raise KeyError(name)
+    def __iter__(self):
+        return iter(self.state.names())
+    def __len__(self):
+        return len(self.state.names())
+    def __repr__(self):
+        return repr(dict(self))
 
 class EarlyReturn(Exception):
     def __init__(self, value):
@@ -21,5 +97,147 @@ class EarlyBreak(Exception):
     def __init__(self, value):
         self.value = value
 
+# What a return or break in statement position evaluates to in the tree walker. Sequences, ifs and trys
+# hand it up as is, until the function call or loop it belongs to unwraps it, so no exception is raised
+class Completion:
+    __slots__ = ('value', 'breaks')
+    def __init__(self, value, breaks=False):
+        self.value = value
+        self.breaks = breaks
+
+# A call in tail position, made by the trampoline of the function that returned it
+class TailCall:
+    __slots__ = ('function', 'args')
+    def __init__(self, function, args):
+        self.function = function
+        self.args = args
+
+# Runs tail calls one after another instead of nesting them, so their depth costs no Python stack
+def trampoline(result):
+    while type(result) is TailCall:
+        function = result.function
+        bounce = getattr(function, "bounce", None)
+        if bounce is None:
+            result = function(*result.args)
+        else:
+            result = bounce(*result.args)
+    return result
+
+# The values of a `while yield` loop, each one worked out when it is asked for, so only the loop's variables are kept
+class Stream:
+    __slots__ = ('values',)
+    def __init__(self, values):
+        self.values = values
+    def __iter__(self):
+        return self
+    def __next__(self):
+        return next(self.values)
+    def __repr__(self):
+        return "<stream>"
+
+@builtin
+def next_(values, *default):
+    # The next value of a stream or any iterator, default (if given) once it is done
+    return next(values, *default)
+
+# Cache size of `func memo name(...)` when the declaration does not give one
+MEMO_SIZE = 1024
+
+# A pure function with the results of its most recent calls kept, keyed by the arguments.
+# maxsize 0 keeps every result; otherwise the least recently used one goes when the cache is full.
+# A function with tail calls runs a pass at a time, as the trampoline runs it: a tail call to a Memo is looked up in
+# its cache, and every call of the chain that missed is given the value the last one returns
+class Memo:
+    def __init__(self, function, maxsize=MEMO_SIZE, name=None):
+        self.function = function
+        self.maxsize = maxsize
+        self.name = name if name is not None else getattr(function, "name", getattr(function, "__name__", "function"))
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.uncached = 0
+    def __repr__(self):
+        return f"<memo {self.name}>"
+    def __call__(self, *args):
+        cache = self.cache
+        try:
+            value = cache[args]
+        except KeyError:
+            self.misses += 1
+            if not hasattr(self.function, "bounce"):
+                value = self.function(*args)
+                self.store(args, value)
+                return value
+            return self.chain(args)
+        except TypeError:
+            # Lists and dicts can not be keys, calls with them always run
+            self.uncached += 1
+            return self.function(*args)
+        self.hits += 1
+        cache.move_to_end(args)
+        return value
+    def store(self, args, value):
+        cache = self.cache
+        cache[args] = value
+        if self.maxsize and len(cache) > self.maxsize:
+            cache.popitem(last=False)
+            self.evictions += 1
+    def chain(self, args):
+        missed = [(self, args)]
+        result = self.function.bounce(*args)
+        while type(result) is TailCall:
+            function = result.function
+            args = tuple(result.args)
+            if type(function) is Memo:
+                try:
+                    result = function.cache[args]
+                except KeyError:
+                    function.misses += 1
+                    missed.append((function, args))
+                except TypeError:
+                    function.uncached += 1
+                else:
+                    function.hits += 1
+                    function.cache.move_to_end(args)
+                    break
+                function = function.function
+            bounce = getattr(function, "bounce", None)
+            if bounce is None:
+                result = function(*args)
+            else:
+                result = bounce(*args)
+        for (memo, args) in missed:
+            memo.store(args, result)
+        return result
+    @property
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "uncached": self.uncached, "size": len(self.cache), "maxsize": self.maxsize}
+    def clear(self):
+        self.cache.clear()
+        self.hits = self.misses = self.evictions = self.uncached = 0
+
+@builtin
+def memo(function, maxsize=MEMO_SIZE):
+    if not callable(function):
+        raise TypeError(f"memo needs a function, not {type(function).__name__}")
+    return Memo(function, maxsize)
+
+@builtin
+def memo_stats(function):
+    return function.stats
+
+@builtin
+def memo_clear(function):
+    function.clear()
+
+# Where offset is in the source the engine runs, subject being its LineIndex, as runtime errors report it
+def where(subject, offset):
+    (row, column) = subject.position(offset or 0)
+    return f"Row: {row}, Column: {column}"
+
 class TypeReturnNode(Exception):
     pass
+
+class CircularImportError(Exception):
+    pass
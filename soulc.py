@@ -0,0 +1,184 @@
+import gc
+import hashlib
+import marshal
+import os
+import sys
+import ast
+from lexer import Token, TokenKind, LineIndex, RegexLexer
+import sparser
+
+######################################
+# PARSED TREE CACHE (.soulc FILES)
+######################################
+
+# A .soulc file holds (VERSION, sha256 of the source, classes, ops, consts) written with marshal.
+# The tree is flattened to a postfix program: every op builds one value from the values before it,
+# so loading is a single loop with no recursion. Bump VERSION whenever the node classes change.
+VERSION = f'soulc 6 {sys.implementation.cache_tag}'
+
+CONST = 0
+LIST = 1
+DICT = 2
+TUPLE = 3
+KIND = 4
+TOKEN = 5
+SEQUENCE = 6
+# NODE + i builds a node described by entry i of the class table
+NODE = 8
+
+NODES = {name: value for (name, value) in vars(ast).items() if isinstance(value, type) and value.__module__ == 'ast'}
+
+class Encoder:
+    def __init__(self):
+        self.ops = bytearray()
+        self.consts = []
+        # (class name, field names) -> position in the class table
+        self.classes = {}
+
+    def encode(self, value):
+        t = type(value)
+        ops = self.ops
+        consts = self.consts
+        if t.__module__ == 'ast':
+            if t == ast.SequenceNode:
+                # Long programs are one left deep chain, store it flat so nothing recurses per statement
+                statements = []
+                while type(value) == ast.SequenceNode:
+                    statements.append(value.second)
+                    value = value.first
+                statements.append(value)
+                for statement in reversed(statements):
+                    self.encode(statement)
+                consts.append(len(statements))
+                ops.append(SEQUENCE)
+                return
+            fields = vars(value)
+            key = (t.__name__, tuple(fields))
+            if key not in self.classes:
+                if NODE + len(self.classes) > 255:
+                    raise ValueError("Too many node layouts to cache")
+                self.classes[key] = len(self.classes)
+            for field in fields.values():
+                self.encode(field)
+            ops.append(NODE + self.classes[key])
+        elif t == list or t == tuple:
+            for item in value:
+                self.encode(item)
+            consts.append(len(value))
+            ops.append(LIST if t == list else TUPLE)
+        elif t == dict:
+            for (key, item) in value.items():
+                self.encode(key)
+                self.encode(item)
+            consts.append(len(value))
+            ops.append(DICT)
+        elif t == TokenKind:
+            consts.append(value.name)
+            ops.append(KIND)
+        elif t == Token:
+            self.encode(value.data)
+            consts.append(value.kind.name)
+            consts.append(value.offset)
+            ops.append(TOKEN)
+        elif value is None or t in (str, int, float, bool):
+            consts.append(value)
+            ops.append(CONST)
+        else:
+            raise ValueError(f"Cannot cache a value of type {t.__name__}")
+
+def encode(tree):
+    encoder = Encoder()
+    encoder.encode(tree)
+    return (list(encoder.classes), bytes(encoder.ops), encoder.consts)
+
+def decode(classes, ops, consts, lines=None):
+    layouts = [(NODES[name], fields, len(fields)) for (name, fields) in classes]
+    stack = []
+    push = stack.append
+    const = iter(consts).__next__
+    for op in ops:
+        if op == CONST:
+            push(const())
+        elif op >= NODE:
+            (cls, fields, n) = layouts[op - NODE]
+            node = cls.__new__(cls)
+            if n:
+                node.__dict__.update(zip(fields, stack[-n:]))
+                del stack[-n:]
+            push(node)
+        elif op == SEQUENCE:
+            n = const()
+            statements = stack[-n:]
+            del stack[-n:]
+            node = statements[0]
+            for statement in statements[1:]:
+                node = ast.SequenceNode(node, statement)
+            push(node)
+        elif op == LIST or op == TUPLE:
+            n = const()
+            items = stack[len(stack)-n:]
+            del stack[len(stack)-n:]
+            push(items if op == LIST else tuple(items))
+        elif op == DICT:
+            n = 2 * const()
+            items = stack[len(stack)-n:]
+            del stack[len(stack)-n:]
+            push(dict(zip(items[0::2], items[1::2])))
+        elif op == KIND:
+            push(TokenKind[const()])
+        elif op == TOKEN:
+            kind = TokenKind[const()]
+            push(Token(kind, stack.pop(), const(), lines))
+    return stack[0]
+
+def digest(source):
+    return hashlib.sha256(source.encode('utf-8')).digest()
+
+def dumps(tree, source):
+    return marshal.dumps((VERSION, digest(source)) + encode(tree))
+
+# Returns the tree stored in data, or None when it was written for another source or version
+def loads(data, source):
+    try:
+        (version, key, classes, ops, consts) = marshal.loads(data)
+    except (EOFError, ValueError, TypeError):
+        return None
+    if version != VERSION or key != digest(source):
+        return None
+    # Decoding only allocates, and never makes cycles, so collections during it would be wasted work
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return decode(classes, ops, consts, LineIndex(source))
+    finally:
+        if enabled:
+            gc.enable()
+
+def cache_path(path):
+    return os.path.splitext(path)[0] + '.soulc'
+
+def parse(source):
+    return sparser.Parser(RegexLexer(source)).parse_statements()
+
+# Parses the source read from path, reusing the tree cached next to it when the source is unchanged
+def load(path, source):
+    cached = cache_path(path)
+    try:
+        with open(cached, 'rb') as f:
+            tree = loads(f.read(), source)
+        if tree is not None:
+            return tree
+    except OSError:
+        pass
+    tree = parse(source)
+    try:
+        data = dumps(tree, source)
+        # Written aside and moved in place, so processes loading the same module never read half a file
+        temp = f'{cached}.{os.getpid()}.tmp'
+        with open(temp, 'wb') as f:
+            f.write(data)
+        os.replace(temp, cached)
+    except (OSError, ValueError):
+        # A read only directory or an uncacheable tree only costs the next run a parse
+        pass
+    return tree
@@ -1,12 +1,34 @@
 from ast import *
 from lexer import *
+from types import MappingProxyType
 
 def update(l, position, new_value):
     l[position] = new_value
 
+LEFT = 0
+RIGHT = 1
+
+# BINARY OPERATOR -> (PRECEDENCE, ASSOCIATIVITY), A HIGHER PRECEDENCE BINDS TIGHTER
+BINARY_OPERATORS = MappingProxyType({
+    TokenKind.ASSIGN: (1, RIGHT),
+    TokenKind.OR: (2, LEFT),
+    TokenKind.AND: (3, LEFT),
+    TokenKind.EQ: (4, LEFT),
+    TokenKind.NEQ: (4, LEFT),
+    TokenKind.LESS: (4, LEFT),
+    TokenKind.GREAT: (4, LEFT),
+    TokenKind.LE: (4, LEFT),
+    TokenKind.GE: (4, LEFT),
+    TokenKind.IN: (4, LEFT),
+    TokenKind.PLUS: (5, LEFT),
+    TokenKind.MINUS: (5, LEFT),
+    TokenKind.MUL: (6, LEFT),
+    TokenKind.DIV: (6, LEFT),
+    TokenKind.DOT: (7, LEFT),
+})
+
 class Parser:
-    token = Token(1, 1, TokenKind.UNKNOWN, "dummy")
-    operators = [TokenKind.PLUS, TokenKind.MINUS, TokenKind.MUL, TokenKind.DIV, TokenKind.EQ, TokenKind.NEQ, TokenKind.LESS, TokenKind.GREAT, TokenKind.IN, TokenKind.LE, TokenKind.GE, TokenKind.AND, TokenKind.OR, TokenKind.DOT, TokenKind.ASSIGN]
+    token = Token(TokenKind.UNKNOWN, "dummy")
 
     def __init__(self, lexer: Lexer):
         self.lexer = lexer
@@ -42,6 +64,9 @@ class Parser:
         self.expect(TokenKind.WHILE)
         if self.accept(TokenKind.RET):
             ret = ""
+        elif self.accept(TokenKind.YIELD):
+            # Lazy: the loop gives a stream that runs one pass for every value asked of it
+            ret = "yield"
         cond = self.parse_statements()
         then = self.parse_block()
         return WhileExpr(cmpt, cond, ret, then)
@@ -52,57 +77,23 @@ class Parser:
         then = self.parse_block()
         els = None
         if self.accept(TokenKind.ELSE):
-            try:
+            if self.token is not None and self.token.kind == TokenKind.THEN:
                 els = self.parse_block()
-            except:
+            else:
                 els = self.parse_expr()
         return IfExpr(cmpt, cond, then, els)
 
-    def prece(self, op: TokenKind):
-        if op == TokenKind.PLUS:
-            return 1
-        if op == TokenKind.MUL:
-            return 2
-        if op == TokenKind.DIV:
-            return 2
-        if op == TokenKind.MINUS:
-            return 1
-        if op == TokenKind.EQ or TokenKind.NEQ or TokenKind.IN or TokenKind.LE or TokenKind.GE:
-            return 3
-        if op == TokenKind.DOT or TokenKind.ASSIGN or TokenKind.AND or TokenKind.OR:
-            return 4
-
-    def next_is_operator(self):
-        return self.token is not None and self.token.kind in self.operators
-
-    def parse_operator_expr(self, cmpt=None):
+    def parse_operator_expr(self, cmpt=None, min_prece=0):
+        # PRECEDENCE CLIMBING: KEEP TAKING OPERATORS THAT BIND AT LEAST AS TIGHTLY AS min_prece
         first = self.parse_term()
-        if self.next_is_operator():
-            op = self.parse_operator()
-            return self.parse_binop(first, op)  # parse binop needs to be given the previous value and
-                                                # operator, the way i wrote it
-        else:
-            return first
-
-    def expect_any(self, kinds: list(TokenKind)):
-        if self.token.kind in kinds:
-            return self.consume()
-
-    def parse_operator(self, cmpt=None):
-        return self.expect_any(self.operators).kind
-
-    def parse_binop(self, first, op, cmpt=None):
-        second = self.parse_term()
-        if self.next_is_operator():
-            next_ = self.parse_operator()
-            if self.prece(op) >= self.prece(next_):
-                return self.parse_binop(BinOp(first, op, second), next_)  # Binop(first, op, second) becomes the
-                                                                    # first for the recursive call
-            else:  # prece(next) > prece(op)
-                return BinOp(first, op, self.parse_binop(second, next_))  # recurse to the right, and make the
-                                                                    # resulting expr the second for this call
-        else:
-            return BinOp(first, op, second)
+        while self.token is not None and self.token.kind in BINARY_OPERATORS:
+            (prece, assoc) = BINARY_OPERATORS[self.token.kind]
+            if prece < min_prece:
+                break
+            op = self.consume().kind
+            second = self.parse_operator_expr(None, prece + 1 if assoc == LEFT else prece)
+            first = BinOp(first, op, second)
+        return first
 
     def parse_num(self, cmpt=None):
         data = self.expect(TokenKind.INT).data
@@ -159,9 +150,14 @@ class Parser:
         d = self.parse_expr()
         return Print(d)
 
-    def parse_function(self, cmpt=None):
-        self.expect(TokenKind.FUNC)
+    def parse_function(self, cmpt=None, asynchronous=False):
+        offset = self.expect(TokenKind.FUNC).offset
         name = self.expect(TokenKind.IDENT).data
+        memo = None
+        if name == "memo" and self.token.kind in (TokenKind.IDENT, TokenKind.INT):
+            # func memo fib(x) caches results, func memo 100 fib(x) keeps at most 100 of them
+            memo = int(self.expect(TokenKind.INT).data) if self.token.kind == TokenKind.INT else MEMO_SIZE
+            name = self.expect(TokenKind.IDENT).data
         self.expect(TokenKind.LPAREN)
         params = {}
         while self.token.kind == TokenKind.IDENT:
@@ -173,15 +169,28 @@ class Parser:
                 update(params, t, "any")
             self.accept(TokenKind.COMMA)
         self.expect(TokenKind.RPAREN)
-        try:
-            rt = self.parse_term()
-        except:
+        if self.token is not None and self.token.kind == TokenKind.THEN:
             rt = "any"
+        else:
+            rt = self.parse_term()
         code = self.parse_block()
-        return FunctionNode(cmpt, name, params, rt, code)
+        return FunctionNode(cmpt, name, params, rt, code, memo, asynchronous, offset)
 # WORKING: func foo(arg) int { return arg }
 # WORKING: func foo(arg) { return arg }
 
+    def parse_async(self, cmpt=None):
+        self.expect(TokenKind.ASYNC)
+        return self.parse_function(cmpt, True)
+# WORKING: async func fetch(path) { return await read_async(path) }
+
+    def parse_await(self):
+        self.expect(TokenKind.AWAIT)
+        return Await(self.parse_term())
+
+    def parse_spawn(self):
+        self.expect(TokenKind.SPAWN)
+        return Spawn(self.parse_term())
+
     def parse_cat(self, cmpt=None):
         self.expect(TokenKind.CAT)
         name = self.expect(TokenKind.IDENT).data
@@ -200,14 +209,14 @@ class Parser:
         value = self.parse_operator_expr()
         return BreakNode(cmpt, value)
 
-    def parse_call(self, name, cmpt=None):
+    def parse_call(self, name, cmpt=None, offset=None):
         args = []
         while self.token.kind != TokenKind.RPAREN:
             # CHECK TO SEE IF THIS CAUSES AN ERROR, IF IT DOES CHANGE BACK TO parse_operator_expr()
             args.append(self.parse_expr())
             self.accept(TokenKind.COMMA)
         self.expect(TokenKind.RPAREN)
-        return Call(cmpt, name, args)
+        return Call(cmpt, name, args, offset)
 
     def parse_run(self, cmpt=None):
         c = None
@@ -251,11 +260,9 @@ class Parser:
         s = None
         left = self.parse_block()
         self.expect(TokenKind.EXCEPT)
-        try:
-            right = self.parse_block()
-        except:
-            s = self.expect(TokenKind.IDENT)
-            right = self.parse_block()
+        if self.token is not None and self.token.kind == TokenKind.IDENT:
+            s = self.consume()
+        right = self.parse_block()
         return TryExceptNode(cmpt, left, s, right)
 
     def parse_raise(self, cmpt=None):
@@ -325,9 +332,10 @@ class Parser:
         pass
 
     def parse_term(self):
+        offset = self.token.offset
         term = self.parse_inner_term()
         if self.accept(TokenKind.LPAREN):
-            return self.parse_call(term)
+            return self.parse_call(term, None, offset)
         else:
             return term
 
@@ -355,6 +363,10 @@ class Parser:
             return self.parse_parenthesized_expr()
         elif t == TokenKind.NEWLINE:
             return self.parse_newline()
+        elif t == TokenKind.AWAIT:
+            return self.parse_await()
+        elif t == TokenKind.SPAWN:
+            return self.parse_spawn()
         else:
             raise SyntaxError(f"Unexpected token {t}. Row: {self.lexer.row}, Column: {self.lexer.column}")
 
@@ -377,6 +389,8 @@ class Parser:
             return self.parse_input(cmpt)
         elif t == TokenKind.FUNC:
             return self.parse_function(cmpt)
+        elif t == TokenKind.ASYNC:
+            return self.parse_async(cmpt)
         elif t == TokenKind.CAT:
             return self.parse_cat()
         elif t == TokenKind.RUN:
@@ -386,9 +400,10 @@ class Parser:
         elif t == TokenKind.BREAK:
             return self.parse_break(cmpt)
         elif t == TokenKind.IDENT:
-            name = self.expect(TokenKind.IDENT).data
+            token = self.expect(TokenKind.IDENT)
+            name = token.data
             if self.accept(TokenKind.LPAREN):
-                return self.parse_call(name, cmpt)
+                return self.parse_call(name, cmpt, token.offset)
             else:
                 return VarExpr(cmpt, name)
         elif t == TokenKind.TRY:
@@ -427,6 +442,8 @@ class Parser:
             return self.parse_input()
         elif t == TokenKind.FUNC:
             return self.parse_function()
+        elif t == TokenKind.ASYNC:
+            return self.parse_async()
         elif t == TokenKind.RUN:
             return self.parse_run()
         elif t == TokenKind.RETURN:
@@ -0,0 +1,151 @@
+import os
+import subprocess
+import sys
+import sysconfig
+import threading
+from importlib import util
+from concurrent.futures import Future
+from runtime import builtin
+
+######################################
+# ASYNC FUNCTIONS, await AND spawn
+######################################
+
+# Calling an `async func` gives a Coroutine, which runs nothing yet. `await` runs it to its value, `spawn` starts it
+# and gives a Task, whose value `await` waits for. The engines evaluate a Soul body as plain Python calls that can
+# not be suspended halfway, so a spawned coroutine runs on a thread of its own, and a Soul body that waits only
+# blocks that thread. The sleeps, reads and processes the builtins below wait for are coroutines of one asyncio
+# event loop, run on a thread of its own, so any number of them overlap while Soul code waits for their values.
+
+# asyncio and the event loop, loaded the first time something is scheduled on it
+asyncio = None
+loop = None
+starting = threading.Lock()
+
+def load_asyncio():
+    # asyncio imports inspect, which needs the ast module of the standard library, not ours. It gets that one
+    # while it is imported, and keeps it, then ast is ours again
+    global asyncio
+    ours = sys.modules["ast"]
+    spec = util.spec_from_file_location("ast", os.path.join(sysconfig.get_paths()["stdlib"], "ast.py"))
+    stdlib = util.module_from_spec(spec)
+    sys.modules["ast"] = stdlib
+    try:
+        spec.loader.exec_module(stdlib)
+        import asyncio as imported
+    finally:
+        sys.modules["ast"] = ours
+    asyncio = imported
+    return asyncio
+
+def event_loop():
+    global loop
+    with starting:
+        if loop is None:
+            running = (asyncio or load_asyncio()).new_event_loop()
+            threading.Thread(target=running.run_forever, name="soul-event-loop", daemon=True).start()
+            loop = running
+    return loop
+
+def awaitable(value):
+    return hasattr(type(value), "__await__")
+
+async def awaited(value):
+    return await value
+
+class Coroutine:
+    __slots__ = ("function", "args", "name")
+    def __init__(self, function, args, name):
+        self.function = function
+        self.args = args
+        self.name = name
+    def __repr__(self):
+        return f"<coroutine {self.name}>"
+    def run(self):
+        return self.function(*self.args)
+
+class AsyncFunction:
+    __slots__ = ("function", "name")
+    def __init__(self, function, name):
+        self.function = function
+        self.name = name
+    def __repr__(self):
+        return f"<async function {self.name}>"
+    def __call__(self, *args):
+        return Coroutine(self.function, args, self.name)
+
+class Task:
+    __slots__ = ("future", "name")
+    def __init__(self, future, name):
+        # A concurrent.futures.Future, which threads and the event loop can both wait for
+        self.future = future
+        self.name = name
+    def __repr__(self):
+        state = "done" if self.future.done() else "running"
+        return f"<task {self.name} {state}>"
+
+def finish(coroutine, future):
+    try:
+        value = coroutine.run()
+    except BaseException as error:
+        future.set_exception(error)
+    else:
+        future.set_result(value)
+
+# value once it is ready: what a coroutine, a task or an awaitable of the builtins gives, anything else as it is
+def wait(value):
+    t = type(value)
+    if t is Coroutine:
+        return value.run()
+    if t is Task:
+        return value.future.result()
+    if awaitable(value):
+        running = event_loop()
+        return asyncio.run_coroutine_threadsafe(awaited(value), running).result()
+    return value
+
+def spawn(value):
+    if type(value) is Coroutine:
+        future = Future()
+        future.set_running_or_notify_cancel()
+        threading.Thread(target=finish, args=(value, future), name=value.name, daemon=True).start()
+        return Task(future, value.name)
+    if type(value) is Task:
+        return value
+    if awaitable(value):
+        running = event_loop()
+        return Task(asyncio.run_coroutine_threadsafe(awaited(value), running), type(value).__name__)
+    raise TypeError(f"spawn needs the call of an async function or an awaitable, not {type(value).__name__}")
+
+# The builtins below give coroutines of the event loop, which asyncio runs once they are awaited or spawned
+
+@builtin
+async def sleep(seconds):
+    await asyncio.sleep(seconds)
+
+def read(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read()
+
+@builtin
+async def read_async(path):
+    # The text of the file at path, read on a worker thread of the event loop
+    return await asyncio.to_thread(read, path)
+
+@builtin
+async def run_async(command, stdin=None):
+    # Runs a shell command line, or a list of a program and its args, to {status, output, errors}
+    data = None if stdin is None else str(stdin).encode("utf-8")
+    pipes = {"stdin": subprocess.PIPE if data is not None else subprocess.DEVNULL, "stdout": subprocess.PIPE, "stderr": subprocess.PIPE}
+    if type(command) is str:
+        process = await asyncio.create_subprocess_shell(command, **pipes)
+    else:
+        process = await asyncio.create_subprocess_exec(*[str(arg) for arg in command], **pipes)
+    (output, errors) = await process.communicate(data)
+    return {"status": process.returncode, "output": output.decode("utf-8", "replace"), "errors": errors.decode("utf-8", "replace")}
+
+@builtin
+def gather(values):
+    # The values of every coroutine, task and awaitable of a list, waited for side by side
+    tasks = [spawn(value) for value in values]
+    return [wait(task) for task in tasks]
@@ -0,0 +1,32 @@
+import os
+import sys
+
+######################################
+# A STAND-IN FOR `nim c` IN THE BUILD TESTS
+######################################
+
+# Takes the arguments Builder gives nim, `c [flags] --nimcache:DIR --out:FILE file.nim`, and writes an executable
+# to FILE that prints the .nim it was built from. Every build is logged to $STUBNIM_LOG, and $STUBNIM_STATUS makes
+# the build fail with that exit status instead.
+
+def main(args):
+    if os.environ.get("STUBNIM_LOG"):
+        with open(os.environ["STUBNIM_LOG"], "a") as log:
+            log.write(" ".join(args) + "\n")
+    status = int(os.environ.get("STUBNIM_STATUS", "0"))
+    if status:
+        print(f"stubnim: failing with status {status}", file=sys.stderr)
+        return status
+    if args[:1] != ["c"]:
+        print(f"stubnim: expected the c command, not {args[:1]}", file=sys.stderr)
+        return 2
+    options = dict(arg[2:].split(":", 1) for arg in args if arg.startswith("--") and ":" in arg)
+    source = args[-1]
+    os.makedirs(options["nimcache"], exist_ok=True)
+    with open(options["out"], "w") as out:
+        out.write(f"#!{sys.executable}\nprint({('built from ' + os.path.basename(source))!r})\n")
+    os.chmod(options["out"], 0o755)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,69 @@
+import os
+import shlex
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+######################################
+# main.py -r WITH A STUB NIM COMPILER
+######################################
+
+# Transpiles a program and builds it with stubnim.py in place of nim, in a scratch directory, to check what
+# Builder does with a fresh build, an unchanged one, a failing compiler and one that is not there.
+# Run them as a script, like test_engines.py: python tests/test_build.py
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+STUB = shlex.join([sys.executable, os.path.join(ROOT, "tests", "stubnim.py")])
+
+class BuildWithStub(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.log = os.path.join(self.directory, "builds.log")
+        with open(os.path.join(self.directory, "hello.soul"), "w") as f:
+            f.write('print "hello"\n')
+
+    def run_main(self, compiler=STUB, status=0):
+        env = dict(os.environ, STUBNIM_LOG=self.log, STUBNIM_STATUS=str(status))
+        command = [sys.executable, MAIN, "-r", "--nim", compiler, "--cache-dir", os.path.join(self.directory, "cache"), "hello.soul"]
+        return subprocess.run(command, cwd=self.directory, env=env, capture_output=True, text=True, timeout=120)
+
+    def builds(self):
+        if not os.path.exists(self.log):
+            return 0
+        with open(self.log) as f:
+            return len(f.readlines())
+
+    def test_build_runs_the_executable(self):
+        done = self.run_main()
+        self.assertEqual(done.returncode, 0, done.stderr)
+        self.assertIn("Built in:", done.stdout)
+        self.assertIn("built from hello.nim", done.stdout)
+        self.assertEqual(self.builds(), 1)
+
+    def test_unchanged_build_is_skipped(self):
+        self.assertEqual(self.run_main().returncode, 0)
+        done = self.run_main()
+        self.assertEqual(done.returncode, 0, done.stderr)
+        self.assertIn("Build skipped, hello.nim is unchanged", done.stdout)
+        self.assertIn("built from hello.nim", done.stdout)
+        self.assertEqual(self.builds(), 1)
+
+    def test_failing_compiler_status_passes_through(self):
+        done = self.run_main(status=3)
+        self.assertEqual(done.returncode, 3)
+        self.assertIn("failed on hello.nim with status 3", done.stdout)
+        # Nothing was stamped, so the next build runs the compiler again
+        self.assertEqual(self.run_main().returncode, 0)
+        self.assertEqual(self.builds(), 2)
+
+    def test_missing_compiler_is_127(self):
+        done = self.run_main(os.path.join(self.directory, "no-such-nim"))
+        self.assertEqual(done.returncode, 127)
+        self.assertIn("Could not run", done.stdout)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+import unittest
+
+######################################
+# THE ENGINES AGREE ON EVERY PROGRAM
+######################################
+
+# Runs each program with main.py on the tree walker, the closure compiler and the VM, and checks they print the
+# same. Every run is its own process, with the program's directory as the cwd, so imports and globals start fresh.
+# The interpreter's ast module shadows the standard one, which unittest needs, so the tests only go through main.py
+# and run as a script from anywhere: python tests/test_engines.py
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+ENGINES = ("ast", "closure", "vm")
+
+# The small programs written for these tests, quick enough to run again under the profiler
+CASES = [os.path.join("tests", "programs", name) for name in (
+    "arrays.soul", "control.soul", "features.soul", "memo.soul", "opt.soul", "prec.soul", "scope.soul", "self.soul",
+    "streams.soul", "tail.soul",
+)]
+PROGRAMS = CASES + ["calls.soul", "fib.soul", "gen_test.soul"] + [os.path.join("bench", name) for name in (
+    "arrays.soul", "imports.soul", "loops.soul", "stress.soul", "strings.soul",
+)]
+
+def run(path, engine, *options):
+    (directory, name) = os.path.split(os.path.join(ROOT, path))
+    done = subprocess.run(
+        [sys.executable, MAIN, "--no-cache", "--engine", engine, *options, name],
+        cwd=directory, capture_output=True, text=True, timeout=300,
+    )
+    # The timing line is the only one that differs from run to run
+    output = [line for line in done.stdout.splitlines() if not line.startswith("Executed in:")]
+    return (done.returncode, output, done.stderr)
+
+class EnginesAgree(unittest.TestCase):
+    def test_programs(self):
+        for path in PROGRAMS:
+            with self.subTest(program=path):
+                runs = {}
+                for engine in ENGINES:
+                    (status, output, errors) = run(path, engine)
+                    self.assertEqual(status, 0, f"{path} failed on {engine}:\n{errors}")
+                    runs[engine] = output
+                self.assertEqual(runs["closure"], runs["ast"], f"{path}: closure differs from ast")
+                self.assertEqual(runs["vm"], runs["ast"], f"{path}: vm differs from ast")
+
+    def test_profiled_programs(self):
+        # Profiling must not change whether a program runs or what it prints, the table comes after its output
+        for path in CASES:
+            for engine in ENGINES:
+                with self.subTest(program=path, engine=engine):
+                    (status, output, errors) = run(path, engine)
+                    (profiled, table, errors) = run(path, engine, "--profile-calls")
+                    self.assertEqual(profiled, 0, f"{path} failed on {engine} with --profile-calls:\n{errors}")
+                    self.assertEqual(table[:len(output)], output)
+
+    def test_error_position(self):
+        # A runtime error points at the call in the source, not at its start
+        for engine in ENGINES:
+            with self.subTest(engine=engine):
+                (status, output, errors) = run(os.path.join("tests", "programs", "badcall.soul"), engine)
+                self.assertNotEqual(status, 0)
+                self.assertEqual(output[-1:], ["5"])
+                self.assertIn("does not belong to a function. Row: 3, Column: 8", errors)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+######################################
+# THE NIM main.py -c WRITES IS WHOLE
+######################################
+
+# Transpiles programs in a scratch directory and checks every block the Nim opens, a proc, if, else, while or try,
+# has a body. A statement that can not be transpiled runs at compile time instead, and must not leave the part
+# of it written so far behind. Run them as a script, like test_engines.py: python tests/test_transpile.py
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN = os.path.join(ROOT, "main.py")
+
+PROGRAMS = ["calls.soul", "fib.soul"] + [os.path.join("bench", name) for name in ("loops.soul", "strings.soul", "stress.soul")]
+
+def indent(line):
+    return len(line) - len(line.lstrip(" "))
+
+def empty_blocks(nim):
+    lines = [line for line in nim.splitlines() if line.strip()]
+    return [line for (line, after) in zip(lines, lines[1:] + [""]) if line.rstrip().endswith(("=", ":")) and indent(after) <= indent(line)]
+
+class TranspiledBlocks(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def run_main(self, name, cached=False):
+        # Cached runs go through the .soulm manifest, as -c does by default
+        command = [sys.executable, MAIN, "-c", name] + ([] if cached else ["--no-cache"])
+        return subprocess.run(command, cwd=self.directory, capture_output=True, text=True, timeout=300)
+
+    def transpile(self, path, cached=False):
+        name = os.path.basename(path)
+        if not os.path.exists(os.path.join(self.directory, name)):
+            shutil.copy(os.path.join(ROOT, path), self.directory)
+        done = self.run_main(name, cached)
+        self.assertEqual(done.returncode, 0, done.stderr)
+        with open(os.path.join(self.directory, os.path.splitext(name)[0] + ".nim")) as f:
+            return f.read()
+
+    def write(self, name, source):
+        with open(os.path.join(self.directory, name), "w") as f:
+            f.write(source)
+
+    def test_blocks_have_bodies(self):
+        for path in PROGRAMS:
+            with self.subTest(program=path):
+                self.assertEqual(empty_blocks(self.transpile(path)), [])
+
+    def test_transpiled_statements_do_not_run(self):
+        # What went into the Nim only runs once the Nim does, cached or not
+        self.write("effects.soul", 'var n = write_text("out.txt", "x");\nprint n\n')
+        for cached in (False, True, True):
+            with self.subTest(cached=cached):
+                self.assertIn("write_text(", self.transpile("effects.soul", cached))
+                self.assertFalse(os.path.exists(os.path.join(self.directory, "out.txt")))
+
+    def test_cached_transpile_is_the_same(self):
+        for path in PROGRAMS:
+            with self.subTest(program=path):
+                fresh = self.transpile(path)
+                # The first cached run emits every statement, the second reuses them all
+                self.assertEqual(self.transpile(path, True), fresh)
+                self.assertEqual(self.transpile(path, True), fresh)
+
+    def test_statement_that_runs_nowhere_fails(self):
+        # The loop can not be transpiled, and at compile time j is not there, it only exists in the Nim program
+        self.write("loop.soul", "var j = 0;\nvar k = while j < 9 { var j = j + 1; if j == 7 { break j } };\nprint k\n")
+        for cached in (False, True):
+            with self.subTest(cached=cached):
+                done = self.run_main("loop.soul", cached)
+                self.assertNotEqual(done.returncode, 0)
+                self.assertIn("NameError", done.stderr)
+
+    def test_untyped_variable_of_two_blocks_is_not_transpiled(self):
+        # Soul reads 2.5 as 2."5", so k has no type: Nim can not declare it before the if, and in one branch the other
+        # never sees it
+        self.write("branches.soul", "func f(a, b) { if a > 0 { var k = a * 2.5 } else { var k = 1 }; return k + b };\nprint f(2, 3)\n")
+        nim = self.transpile("branches.soul")
+        self.assertNotIn("proc f(", nim)
+        self.assertNotIn("k = 1", nim)
+
+    def test_untyped_variable_of_one_block_is_declared_there(self):
+        self.write("block.soul", 'func h(n) { var i = 0; while i < n { var t = n."x"; print t; var i = i + 1 }; return i };\nprint h(2)\n')
+        nim = self.transpile("block.soul")
+        self.assertIn("proc h(", nim)
+        self.assertIn('        var t = n."x"', nim)
+
+    def test_failed_proc_is_left_out(self):
+        # third()'s loop breaks with a value, so the whole proc runs at compile time, header and all
+        nim = self.transpile("calls.soul")
+        self.assertIn("proc clamp(", nim)
+        self.assertNotIn("proc third(", nim)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,813 @@
+import operator
+from runtime import *
+from lexer import TokenKind
+from ast import *
+from modules import registry
+import profiler
+import tasks
+
+######################################
+# OPCODES
+######################################
+
+CONST = 0
+LOAD_NAME = 1
+STORE_NAME = 2
+ASSIGN = 3
+POP = 4
+BINARY = 5
+JUMP = 6
+JUMP_IF_FALSE = 7
+JUMP_IF_FALSE_OR_POP = 8
+JUMP_IF_TRUE_OR_POP = 9
+CALL = 10
+RETURN = 11
+MAKE_FUNCTION = 12
+PRINT = 13
+INPUT = 14
+ASSERT = 15
+RAISE = 16
+BUILD_LIST = 17
+LIST_APPEND = 18
+BREAK = 19
+BREAK_OUT = 20
+SETUP_TRY = 21
+POP_TRY = 22
+EXCEPT = 23
+INIT = 24
+IMPORT = 25
+EVAL = 26
+BINARY_CONST = 27
+JUMP_UNLESS = 28
+JUMP_UNLESS_CONST = 29
+NAME_BINARY_CONST = 30
+NAME_JUMP_UNLESS_CONST = 31
+LOAD_SLOT = 32
+LOAD_DEREF = 33
+LOAD_GLOBAL = 34
+STORE_SLOT = 35
+ASSIGN_SLOT = 36
+SLOT_BINARY_CONST = 37
+SLOT_JUMP_UNLESS_CONST = 38
+TAIL_CALL = 39
+COUNT = 40
+MAKE_PROFILED = 41
+MAKE_STREAM = 42
+MAKE_ASYNC = 43
+AWAIT = 44
+SPAWN = 45
+SETUP_LOOP = 46
+
+# WHAT A PASS OF A `while yield` GIVES ONCE ITS CONDITION FAILS
+END = object()
+
+OPNAMES = {v: k for k, v in list(globals().items()) if k.isupper() and type(v) == int}
+
+def dot(obj, name):
+    # NOTE: Enums are accessed by doing: (x being an enum with atribute Y) x."Y"
+    try:
+        return getattr(obj, name)
+    except:
+        return obj[name]
+
+BINOPS = {
+    TokenKind.PLUS: operator.add,
+    TokenKind.MINUS: operator.sub,
+    TokenKind.MUL: operator.mul,
+    TokenKind.DIV: operator.truediv,
+    TokenKind.EQ: operator.eq,
+    TokenKind.NEQ: operator.ne,
+    TokenKind.GREAT: operator.gt,
+    TokenKind.LESS: operator.lt,
+    TokenKind.IN: lambda a, b: a in b,
+    TokenKind.GE: operator.ge,
+    TokenKind.LE: operator.le,
+    TokenKind.DOT: dot,
+}
+
+# STACK EFFECT OF THE OPCODES WITH A FIXED ONE
+EFFECT = {
+    CONST: 1, LOAD_NAME: 1, STORE_NAME: -1, ASSIGN: 0, POP: -1, BINARY: -1, JUMP: 0,
+    JUMP_IF_FALSE: -1, MAKE_FUNCTION: 1, PRINT: 0, INPUT: 0, ASSERT: 0, RAISE: 0,
+    BUILD_LIST: 1, LIST_APPEND: -1, SETUP_TRY: 0, POP_TRY: 0, EXCEPT: -1, INIT: 0,
+    IMPORT: 1, EVAL: 1, BINARY_CONST: 0, JUMP_UNLESS: -2, JUMP_UNLESS_CONST: -1,
+    NAME_BINARY_CONST: 1, NAME_JUMP_UNLESS_CONST: 0, LOAD_SLOT: 1, LOAD_DEREF: 1, LOAD_GLOBAL: 1,
+    STORE_SLOT: -1, ASSIGN_SLOT: 0, SLOT_BINARY_CONST: 1, SLOT_JUMP_UNLESS_CONST: 0,
+    COUNT: 0, MAKE_PROFILED: 1, MAKE_STREAM: 1, MAKE_ASYNC: 1, AWAIT: 0, SPAWN: 0, SETUP_LOOP: 0,
+}
+
+# SUPERINSTRUCTIONS THAT ABSORB A PRECEDING LOAD
+FUSED = {
+    (LOAD_NAME, BINARY_CONST): NAME_BINARY_CONST,
+    (LOAD_NAME, JUMP_UNLESS_CONST): NAME_JUMP_UNLESS_CONST,
+    (LOAD_SLOT, BINARY_CONST): SLOT_BINARY_CONST,
+    (LOAD_SLOT, JUMP_UNLESS_CONST): SLOT_JUMP_UNLESS_CONST,
+}
+
+CONSTANTS = {
+    "NumExpr": lambda node: node.val,
+    "String": lambda node: node.string,
+    "TrueNode": lambda node: True,
+    "FalseNode": lambda node: False,
+    "NoneNode": lambda node: None,
+}
+
+def is_constant(node):
+    return type(node).__name__ in CONSTANTS
+
+def constant(node):
+    return CONSTANTS[type(node).__name__](node)
+
+class Code:
+    def __init__(self, name):
+        self.name = name
+        self.ops = []
+    def __repr__(self):
+        return f"<code {self.name}>"
+    def dis(self):
+        lines = []
+        for (pc, (op, arg)) in enumerate(self.ops):
+            lines.append(f"{pc:4} {OPNAMES[op]:<22}{'' if arg is None else describe(arg)}")
+        return "\n".join(lines)
+
+def describe(arg):
+    if type(arg) == tuple:
+        return "("+", ".join(map(describe, arg))+")"
+    if isinstance(arg, AST):
+        return type(arg).__name__
+    if callable(arg):
+        return getattr(arg, "__name__", repr(arg))
+    return repr(arg)
+
+######################################
+# COMPILER (AST -> BYTECODE)
+######################################
+
+class Compiler:
+    def __init__(self):
+        self.code = None
+        self.depth = 0
+        self.loops = []
+        self.stream = False
+        # try blocks open around the code being compiled, a break pops those it jumps out of
+        self.tries = 0
+
+    def compile_program(self, node, name="<main>"):
+        return self.compile_code(name, node)
+
+    def compile_code(self, name, node):
+        outer = (self.code, self.depth, self.loops, self.stream, self.tries)
+        self.code = Code(name)
+        self.depth = 0
+        self.loops = []
+        self.stream = False
+        self.tries = 0
+        self.compile(node)
+        self.emit(RETURN)
+        code = self.code
+        (self.code, self.depth, self.loops, self.stream, self.tries) = outer
+        return code
+
+    # ONE PASS OF A `while yield`: THE VALUE OF THE BODY, OR END ONCE THE CONDITION FAILS OR A RETURN ENDS THE STREAM
+    def compile_stream(self, node):
+        outer = (self.code, self.depth, self.loops, self.stream, self.tries)
+        self.code = Code("<stream>")
+        self.depth = 0
+        self.loops = []
+        self.stream = True
+        self.tries = 0
+        exit = self.jump_unless(node.cond)
+        self.compile(node.left)
+        self.emit(RETURN)
+        self.patch(exit)
+        self.emit(CONST, END)
+        self.emit(RETURN)
+        code = self.code
+        (self.code, self.depth, self.loops, self.stream, self.tries) = outer
+        return code
+
+    def emit(self, op, arg=None, effect=None):
+        ops = self.code.ops
+        # THE FUSED OP TAKES THE LOAD'S INDEX, SO JUMPS TO THE LOAD STILL LAND ON IT
+        if ops and (ops[-1][0], op) in FUSED:
+            (load, operand) = ops.pop()
+            self.depth -= EFFECT[load]
+            (op, arg) = (FUSED[(load, op)], (operand if load == LOAD_SLOT else (operand,))+arg)
+        ops.append((op, arg))
+        self.depth += EFFECT.get(op, 0) if effect is None else effect
+        return len(self.code.ops) - 1
+
+    def label(self):
+        return len(self.code.ops)
+
+    # JUMP TARGETS ARE ALWAYS THE LAST ELEMENT OF THE ARGUMENT
+    def patch(self, at, target=None):
+        op, arg = self.code.ops[at]
+        target = self.label() if target is None else target
+        self.code.ops[at] = (op, arg[:-1]+(target,) if type(arg) == tuple else target)
+
+    # POPS THE CONDITION AND JUMPS WHEN IT IS FALSE, FUSING COMPARISONS INTO THE BRANCH
+    def jump_unless(self, cond):
+        if type(cond).__name__ == "BinOp" and cond.op in BINOPS and cond.op != TokenKind.DOT:
+            self.compile(cond.first)
+            if is_constant(cond.second):
+                return self.emit(JUMP_UNLESS_CONST, (BINOPS[cond.op], constant(cond.second), None))
+            self.compile(cond.second)
+            return self.emit(JUMP_UNLESS, (BINOPS[cond.op], None))
+        self.compile(cond)
+        return self.emit(JUMP_IF_FALSE)
+
+    # LEAVES EXACTLY ONE VALUE ON THE STACK
+    def compile(self, node):
+        getattr(self, "compile_"+type(node).__name__, self.compile_fallback)(node)
+
+    # LEAVES NOTHING ON THE STACK
+    def discard(self, node):
+        method = getattr(self, "discard_"+type(node).__name__, None)
+        if method is None:
+            self.compile(node)
+            self.emit(POP)
+        else:
+            method(node)
+
+    def compile_fallback(self, node):
+        self.emit(EVAL, node)
+
+    def compile_SequenceNode(self, node):
+        self.discard(node.first)
+        self.compile(node.second)
+
+    def discard_SequenceNode(self, node):
+        self.discard(node.first)
+        self.discard(node.second)
+
+    def compile_NumExpr(self, node):
+        self.emit(CONST, node.val)
+
+    def compile_String(self, node):
+        self.emit(CONST, node.string)
+
+    def compile_TrueNode(self, node):
+        self.emit(CONST, True)
+
+    def compile_FalseNode(self, node):
+        self.emit(CONST, False)
+
+    def compile_NoneNode(self, node):
+        self.emit(CONST, None)
+
+    def compile_Comment(self, node):
+        self.emit(CONST, None)
+
+    def discard_Comment(self, node):
+        pass
+
+    def compile_VarExpr(self, node):
+        if node.slot is None:
+            self.emit(LOAD_NAME, node.name)
+        elif node.slot[1] is None:
+            self.emit(LOAD_GLOBAL, (node.slot[0], node.name))
+        elif node.slot[0] == 0:
+            self.emit(LOAD_SLOT, (node.slot[1], node.name))
+        else:
+            self.emit(LOAD_DEREF, (node.slot[0], node.slot[1], node.name))
+
+    def store(self, name, slot):
+        if slot is None:
+            self.emit(STORE_NAME, name)
+        else:
+            self.emit(STORE_SLOT, slot[1])
+
+    def compile_Assign(self, node):
+        self.compile(node.assignment)
+        if node.slot is None:
+            self.emit(ASSIGN, node.var)
+        else:
+            self.emit(ASSIGN_SLOT, (node.slot[1], node.var))
+
+    def discard_Assign(self, node):
+        self.compile(node.assignment)
+        self.store(node.var, node.slot)
+
+    def compile_AlgerbraicVariable(self, node):
+        self.discard_AlgerbraicVariable(node)
+        self.emit(CONST, None)
+
+    def discard_AlgerbraicVariable(self, node):
+        self.emit(CONST, None)
+        self.emit(STORE_NAME, node.var)
+
+    def compile_AlgebraicCalling(self, node):
+        self.emit(LOAD_NAME, node.name)
+        self.emit(POP)
+        self.emit(CONST, None)
+
+    def compile_Print(self, node):
+        self.compile(node.data)
+        self.emit(PRINT)
+
+    def discard_Print(self, node):
+        self.compile_Print(node)
+        self.emit(POP)
+
+    def compile_Echo(self, node):
+        self.compile(node.data)
+
+    def compile_InputNode(self, node):
+        self.compile(node.prompt)
+        self.emit(INPUT)
+
+    def compile_Await(self, node):
+        self.compile(node.value)
+        self.emit(AWAIT)
+
+    def compile_Spawn(self, node):
+        self.compile(node.value)
+        self.emit(SPAWN)
+
+    def compile_AssertNode(self, node):
+        self.compile(node.value)
+        self.emit(ASSERT)
+
+    def compile_RaiseNode(self, node):
+        self.compile(node.value)
+        self.emit(RAISE)
+
+    def compile_InitNode(self, node):
+        self.compile(node.value)
+        self.emit(INIT)
+
+    def compile_Run(self, node):
+        self.emit(IMPORT, node)
+
+    def compile_BinOp(self, node):
+        if node.op == TokenKind.AND or node.op == TokenKind.OR:
+            self.compile(node.first)
+            jump = self.emit(JUMP_IF_FALSE_OR_POP if node.op == TokenKind.AND else JUMP_IF_TRUE_OR_POP, effect=-1)
+            self.compile(node.second)
+            self.patch(jump)
+        elif node.op in BINOPS:
+            self.compile(node.first)
+            if is_constant(node.second):
+                self.emit(BINARY_CONST, (BINOPS[node.op], constant(node.second)))
+            else:
+                self.compile(node.second)
+                self.emit(BINARY, BINOPS[node.op])
+        else:
+            self.compile_fallback(node)
+
+    def compile_Call(self, node):
+        if type(node.func) == str:
+            self.emit(LOAD_NAME, node.func)
+        else:
+            self.compile(node.func)
+        for arg in node.args:
+            self.compile(arg)
+        self.emit(TAIL_CALL if node.tail else CALL, (len(node.args), node.func, node.offset), effect=-len(node.args))
+
+    def compile_IfExpr(self, node):
+        jump = self.jump_unless(node.cond)
+        self.compile(node.left)
+        end = self.emit(JUMP)
+        self.patch(jump)
+        self.depth -= 1
+        if node.right != None:
+            self.compile(node.right)
+        else:
+            self.emit(CONST, None)
+        self.patch(end)
+
+    def discard_IfExpr(self, node):
+        jump = self.jump_unless(node.cond)
+        self.discard(node.left)
+        if node.right != None:
+            end = self.emit(JUMP)
+            self.patch(jump)
+            self.discard(node.right)
+            self.patch(end)
+        else:
+            self.patch(jump)
+
+    def compile_WhileExpr(self, node):
+        if node.ret == "yield":
+            # A stream outlives the frame it was made in, so a pass of it is code of its own, run over that
+            # frame for every value asked of it. A return or a break of the body ends the stream
+            self.emit(MAKE_STREAM, self.compile_stream(node))
+            return
+        base = self.depth
+        # A break in a function called from the body raises, the handler gives its value as the loop's
+        setup = self.emit(SETUP_LOOP)
+        if node.ret != None:
+            self.emit(BUILD_LIST)
+        start = self.label()
+        exit = self.jump_unless(node.cond)
+        breaks = []
+        self.loops.append((base, breaks, self.tries))
+        if node.ret != None:
+            self.compile(node.left)
+            self.emit(LIST_APPEND)
+        else:
+            self.discard(node.left)
+        self.loops.pop()
+        self.emit(JUMP, start)
+        self.patch(exit)
+        if node.ret == None:
+            self.emit(CONST, None)
+        # BREAKS TRUNCATE THE STACK BACK TO WHERE THE LOOP STARTED
+        for at in breaks:
+            self.code.ops[at] = (BREAK, (self.label(), base))
+        self.emit(POP_TRY)
+        self.patch(setup)
+
+    def compile_BreakNode(self, node):
+        if self.loops:
+            self.compile(node.value)
+            (base, breaks, tries) = self.loops[-1]
+            for _ in range(self.tries - tries):
+                self.emit(POP_TRY)
+            breaks.append(self.emit(BREAK, base))
+        elif self.stream:
+            self.end_stream(node)
+        else:
+            self.compile(node.value)
+            self.emit(BREAK_OUT)
+
+    def compile_ReturnNode(self, node):
+        if self.stream:
+            self.end_stream(node)
+        else:
+            self.compile(node.value)
+            self.emit(RETURN)
+
+    def end_stream(self, node):
+        # THE PASS GIVES END, PAST ANY LOOP OR TRY AROUND IT, AND THE VALUE IS DROPPED
+        self.discard(node.value)
+        self.emit(CONST, END)
+        self.emit(RETURN)
+
+    def compile_FunctionNode(self, node):
+        self.discard_FunctionNode(node)
+        self.emit(CONST, None)
+
+    def discard_FunctionNode(self, node):
+        code = self.compile_code(node.name, node.body)
+        # Functions made while --profile-calls records are called through Python, so their calls can be timed
+        if node.asynchronous:
+            self.emit(MAKE_ASYNC, (code, node))
+        else:
+            self.emit(MAKE_FUNCTION if profiler.active is None else MAKE_PROFILED, (code, node))
+        self.emit(STORE_NAME, node.name)
+
+    def compile_TryExceptNode(self, node):
+        setup = self.emit(SETUP_TRY)
+        self.tries += 1
+        self.compile(node.left)
+        self.tries -= 1
+        self.emit(POP_TRY)
+        end = self.emit(JUMP)
+        # THE VM PUSHES THE CAUGHT EXCEPTION IN PLACE OF THE TRY VALUE BEFORE JUMPING HERE
+        self.patch(setup)
+        self.emit(EXCEPT, None if node.specified == None else node.specified.data)
+        self.compile(node.right)
+        self.patch(end)
+
+######################################
+# RUNTIME
+######################################
+
+class Function:
+    def __init__(self, vm, code, env, node):
+        self.vm = vm
+        self.code = code
+        self.env = env
+        self.node = node
+        self.name = node.name
+        self.params = list(node.params)
+        self.return_type = node.return_type
+        self.typed = node.return_type != "any"
+    def __repr__(self):
+        return f"<function {self.name}>"
+    def __call__(self, *args):
+        return self.vm.execute(self.code, self.enter(args), self)
+    def bounce(self, *args):
+        # One pass of the body, a call in tail position comes back as a TailCall for the trampoline to make
+        return self.vm.execute(self.code, self.enter(args), self, True)
+    def enter(self, args):
+        return self.node.enter(self.env, args, self.vm.subject)
+    def check_return(self, value):
+        if type(value) != self.return_type.eval(self.env, self.vm.subject):
+            raise TypeReturnNode(f"Function did not return type specified. {where(self.vm.subject, self.node.offset)}")
+        return value
+
+# A function made while --profile-calls records. Each pass of it is timed on its own and its tail calls go back
+# through the trampoline, as in the closure compiler, so the profiler adds no Python frames to a chain of them
+def profiled(function):
+    bounce = profiler.wrap(function.name, function.bounce)
+    def call(*args):
+        return trampoline(bounce(*args))
+    call.bounce = bounce
+    return call
+
+class VM:
+    def __init__(self, subject=None):
+        self.subject = subject
+
+    def run(self, code, state):
+        return self.execute(code, state, None)
+
+    def execute(self, code, env, fn, bounces=False):
+        ops = code.ops
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        vals = env.vals
+        slots = env.slots
+        handlers = None
+        frames = []
+        pc = 0
+        while True:
+            try:
+                while True:
+                    op, arg = ops[pc]
+                    pc += 1
+                    if op == LOAD_SLOT:
+                        (slot, name) = arg
+                        a = slots[slot]
+                        if a is UNBOUND:
+                            a = env.parent.lookup(name)
+                        push(a)
+                    elif op == LOAD_NAME:
+                        a = vals.get(arg, UNBOUND)
+                        if a is UNBOUND:
+                            a = env.lookup(arg)
+                        push(a)
+                    elif op == CONST:
+                        push(arg)
+                    elif op == STORE_SLOT:
+                        slots[arg] = pop()
+                    elif op == STORE_NAME:
+                        if slots is None:
+                            vals[arg] = pop()
+                        else:
+                            env.bind(arg, pop())
+                    elif op == SLOT_BINARY_CONST:
+                        (slot, name, function, value) = arg
+                        a = slots[slot]
+                        if a is UNBOUND:
+                            a = env.parent.lookup(name)
+                        push(function(a, value))
+                    elif op == NAME_BINARY_CONST:
+                        (name, function, value) = arg
+                        a = vals.get(name, UNBOUND)
+                        if a is UNBOUND:
+                            a = env.lookup(name)
+                        push(function(a, value))
+                    elif op == BINARY:
+                        b = pop()
+                        stack[-1] = arg(stack[-1], b)
+                    elif op == SLOT_JUMP_UNLESS_CONST:
+                        (slot, name, function, value, target) = arg
+                        a = slots[slot]
+                        if a is UNBOUND:
+                            a = env.parent.lookup(name)
+                        if not function(a, value):
+                            pc = target
+                    elif op == NAME_JUMP_UNLESS_CONST:
+                        (name, function, value, target) = arg
+                        a = vals.get(name, UNBOUND)
+                        if a is UNBOUND:
+                            a = env.lookup(name)
+                        if not function(a, value):
+                            pc = target
+                    elif op == JUMP_UNLESS:
+                        (function, target) = arg
+                        b = pop()
+                        if not function(pop(), b):
+                            pc = target
+                    elif op == JUMP:
+                        pc = arg
+                    elif op == CALL:
+                        at = len(stack) - arg[0]
+                        args = stack[at:]
+                        function = stack[at-1]
+                        del stack[at-1:]
+                        if type(function) is Function:
+                            # ENTER FIRST, SO A WRONG NUMBER OF ARGS RAISES IN THE CALLER'S FRAME
+                            callee = function.node.enter(function.env, args, function.vm.subject)
+                            frames.append((ops, pc, stack, env, handlers, fn))
+                            env = callee
+                            vals = env.vals
+                            slots = env.slots
+                            fn = function
+                            ops = function.code.ops
+                            pc = 0
+                            stack = []
+                            push = stack.append
+                            pop = stack.pop
+                            handlers = None
+                        elif callable(function):
+                            push(function(*args))
+                        else:
+                            raise SyntaxError(f"FunctionCallError: The identifier {arg[1]} does not belong to a function. {where(self.subject, arg[2])}")
+                    elif op == RETURN:
+                        value = pop()
+                        if fn is not None and fn.typed:
+                            value = fn.check_return(value)
+                        if not frames:
+                            return value
+                        (ops, pc, stack, env, handlers, fn) = frames.pop()
+                        vals = env.vals
+                        slots = env.slots
+                        push = stack.append
+                        pop = stack.pop
+                        push(value)
+                    elif op == TAIL_CALL:
+                        at = len(stack) - arg[0]
+                        args = stack[at:]
+                        function = stack[at-1]
+                        del stack[at-1:]
+                        if type(function) is Function:
+                            # The callee takes over this frame and returns straight to our caller
+                            env = function.node.enter(function.env, args, function.vm.subject)
+                            vals = env.vals
+                            slots = env.slots
+                            fn = function
+                            ops = function.code.ops
+                            pc = 0
+                            stack = []
+                            push = stack.append
+                            pop = stack.pop
+                            handlers = None
+                        elif bounces and not frames and (hasattr(function, "bounce") or type(function) is Memo):
+                            # THIS PASS WAS MADE BY A TRAMPOLINE, WHICH MAKES THE CALL IN OUR PLACE
+                            return TailCall(function, args)
+                        elif callable(function):
+                            push(function(*args))
+                        else:
+                            raise SyntaxError(f"FunctionCallError: The identifier {arg[1]} does not belong to a function. {where(self.subject, arg[2])}")
+                    elif op == LOAD_GLOBAL:
+                        (depth, name) = arg
+                        state = env
+                        while depth:
+                            state = state.parent
+                            depth -= 1
+                        push(state.lookup(name))
+                    elif op == BINARY_CONST:
+                        (function, value) = arg
+                        stack[-1] = function(stack[-1], value)
+                    elif op == JUMP_UNLESS_CONST:
+                        (function, value, target) = arg
+                        if not function(pop(), value):
+                            pc = target
+                    elif op == JUMP_IF_FALSE:
+                        if not pop():
+                            pc = arg
+                    elif op == POP:
+                        pop()
+                    elif op == LOAD_DEREF:
+                        (depth, slot, name) = arg
+                        state = env
+                        while depth:
+                            state = state.parent
+                            depth -= 1
+                        a = state.slots[slot]
+                        if a is UNBOUND:
+                            a = state.parent.lookup(name)
+                        push(a)
+                    elif op == ASSIGN_SLOT:
+                        (slot, name) = arg
+                        value = stack[-1]
+                        slots[slot] = value
+                        stack[-1] = (type(value), name)
+                    elif op == ASSIGN:
+                        value = stack[-1]
+                        env.bind(arg, value)
+                        stack[-1] = (type(value), arg)
+                    elif op == LIST_APPEND:
+                        value = pop()
+                        stack[-1].append(value)
+                    elif op == BREAK:
+                        (target, base) = arg
+                        value = pop()
+                        del stack[base:]
+                        push(value)
+                        pc = target
+                    elif op == JUMP_IF_FALSE_OR_POP:
+                        if stack[-1]:
+                            pop()
+                        else:
+                            pc = arg
+                    elif op == JUMP_IF_TRUE_OR_POP:
+                        if stack[-1]:
+                            pc = arg
+                        else:
+                            pop()
+                    elif op == BUILD_LIST:
+                        push([])
+                    elif op == MAKE_FUNCTION:
+                        (body, node) = arg
+                        if node.memo is None:
+                            push(Function(self, body, env, node))
+                        else:
+                            push(Memo(Function(self, body, env, node), node.memo, node.name))
+                    elif op == PRINT:
+                        value = stack[-1]
+                        if value is not None:
+                            print(value)
+                        stack[-1] = None
+                    elif op == SETUP_TRY:
+                        if handlers is None:
+                            handlers = []
+                        handlers.append((arg, len(stack), None))
+                    elif op == POP_TRY:
+                        handlers.pop()
+                    elif op == EXCEPT:
+                        error = pop()
+                        if arg is not None:
+                            kind = env.lookup(arg)
+                            if not (isinstance(kind, type) and isinstance(error, kind)):
+                                raise error
+                    elif op == INPUT:
+                        stack[-1] = input(stack[-1])
+                    elif op == ASSERT:
+                        assert stack[-1]
+                        stack[-1] = None
+                    elif op == RAISE:
+                        raise pop()
+                    elif op == BREAK_OUT:
+                        raise EarlyBreak(pop())
+                    elif op == INIT:
+                        env.bind("self", stack[-1])
+                        try:
+                            env.lookup("self")()
+                        except:
+                            env.lookup("self")
+                        stack[-1] = None
+                    elif op == IMPORT:
+                        push(self.load(arg, env))
+                    elif op == EVAL:
+                        push(arg.eval(env, self.subject))
+                    elif op == COUNT:
+                        # ONLY EMITTED WHILE A --profile IS RECORDED, LAST SO NO OTHER OP PAYS FOR IT
+                        arg["nodes evaluated"] += 1
+                    elif op == MAKE_PROFILED:
+                        (body, node) = arg
+                        function = profiled(Function(self, body, env, node))
+                        push(function if node.memo is None else Memo(function, node.memo, node.name))
+                    elif op == MAKE_STREAM:
+                        push(Stream(self.stream(arg, env)))
+                    elif op == MAKE_ASYNC:
+                        # CALLS OF AN `async func` GO THROUGH PYTHON, TO GIVE A COROUTINE INSTEAD OF RUNNING
+                        (body, node) = arg
+                        function = Function(self, body, env, node)
+                        if profiler.active is not None:
+                            function = profiled(function)
+                        if node.memo is not None:
+                            function = Memo(function, node.memo, node.name)
+                        push(tasks.AsyncFunction(function, node.name))
+                    elif op == AWAIT:
+                        stack[-1] = tasks.wait(stack[-1])
+                    elif op == SPAWN:
+                        stack[-1] = tasks.spawn(stack[-1])
+                    elif op == SETUP_LOOP:
+                        # A HANDLER THAT ONLY CATCHES THE EarlyBreak OF A CALLED FUNCTION, ONCE PER LOOP RUN
+                        if handlers is None:
+                            handlers = []
+                        handlers.append((arg, len(stack), EarlyBreak))
+                    else:
+                        raise RuntimeError(f"Unknown opcode {op}")
+            except Exception as error:
+                # UNWIND TO THE NEAREST TRY BLOCK, OR LOOP FOR A BREAK, POPPING FRAMES ON THE WAY
+                while True:
+                    while not handlers:
+                        if not frames:
+                            raise
+                        (ops, pc, stack, env, handlers, fn) = frames.pop()
+                        vals = env.vals
+                        slots = env.slots
+                        push = stack.append
+                        pop = stack.pop
+                    (pc, depth, catches) = handlers.pop()
+                    if catches is None or type(error) is catches:
+                        break
+                del stack[depth:]
+                # A TRY GETS THE EXCEPTION, A LOOP THE VALUE IT BROKE WITH
+                push(error if catches is None else error.value)
+
+    def stream(self, code, env):
+        execute = self.execute
+        try:
+            while True:
+                value = execute(code, env, None)
+                if value is END:
+                    return
+                yield value
+        except EarlyBreak:
+            return
+
+    def load(self, node, state):
+        if node.c != None:
+            return node.eval(state, self.subject)
+        def module(tree, namespace, lines):
+            return VM(lines).execute(Compiler().compile_program(tree, str(node.file)), namespace, None)
+        return registry.import_into(node.file, state, module)